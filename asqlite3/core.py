@@ -127,6 +127,9 @@ class Connection:
     async def executescript(self, script: str) -> Cursor:
         return Cursor(self, await self._execute(self._conn.executescript, script))
 
+    async def run_sync(self, fn: Callable[..., R], *args, **kwargs) -> R:
+        return await self._execute(fn, self._conn, *args, **kwargs)
+
     async def interrupt(self):
         return self._conn.interrupt()
 
@@ -0,0 +1,156 @@
+# PikalaxBOT - A Discord bot in discord.py
+# Copyright (C) 2018-2021  PikalaxALT
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Markov chain throughput and memory benchmark.
+
+Builds each chain implementation from the first N messages of a corpus
+for every size asked for, and reports learn throughput, generate
+latency, unlearn cost and memory measured with tracemalloc. The corpus
+is one message per line, or synthetic text with a Zipf-like word
+distribution if none is given.
+
+Chain learns every order up to --state-size, CounterChain only the
+longest, so their state counts differ.
+
+usage: python3 -m benchmarks.markov [--corpus FILE] [--sizes N ...] [--impl chain counter]
+"""
+
+import gc
+import sys
+import time
+import random
+import argparse
+import itertools
+import statistics
+import tracemalloc
+
+from pikalaxbot.cogs.utils.markov import Chain, CounterChain
+
+IMPLEMENTATIONS = {
+    'chain': Chain,
+    'counter': CounterChain,
+}
+
+
+def synthetic_corpus(n: int, vocab_size: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    vocab = set()
+    while len(vocab) < vocab_size:
+        vocab.add(''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(1, 10))))
+    vocab = sorted(vocab)
+    rng.shuffle(vocab)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, vocab_size + 1)))
+    return [
+        ' '.join(rng.choices(vocab, cum_weights=cum_weights, k=min(1 + int(rng.expovariate(1 / 8)), 60)))
+        for _ in range(n)
+    ]
+
+
+def read_corpus(path: str, n: int) -> list[str]:
+    with open(path, encoding='utf-8') as fp:
+        messages = [line.strip() for line in itertools.islice(fp, n)]
+    return [message for message in messages if message]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def build(impl: type, messages: list[str], state_size: int):
+    chain = impl(state_size, store_lowercase=True)
+    for message in messages:
+        chain.learn_str(message)
+    return chain
+
+
+def measure(impl: type, messages: list[str], args) -> dict[str, float]:
+    gc.collect()
+    start = time.perf_counter()
+    chain = build(impl, messages, args.state_size)
+    learn_time = time.perf_counter() - start
+
+    latencies = []
+    generated = 0
+    for _ in range(args.generate):
+        start = time.perf_counter()
+        generated += len(chain.generate(args.maxlen))
+        latencies.append(time.perf_counter() - start)
+
+    forgotten = messages[::10]
+    start = time.perf_counter()
+    for message in forgotten:
+        chain.unlearn_str(message)
+    unlearn_time = time.perf_counter() - start
+    del chain
+
+    # Separately, since tracing slows everything down
+    gc.collect()
+    tracemalloc.start()
+    chain = build(impl, messages, args.state_size)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'messages': len(messages),
+        'words': sum(len(message.split()) for message in messages),
+        'states': len(chain.tbl),
+        'learn_s': learn_time,
+        'gen_mean_us': statistics.fmean(latencies) * 1e6,
+        'gen_p95_us': percentile(latencies, 0.95) * 1e6,
+        'gen_max_us': max(latencies) * 1e6,
+        'gen_words': generated / len(latencies),
+        'unlearn_us': unlearn_time / len(forgotten) * 1e6,
+        'bytes': size,
+        'peak': peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Markov chain implementations')
+    parser.add_argument('--corpus', help='one message per line; synthetic text if not given')
+    parser.add_argument('--sizes', type=int, nargs='+', default=(10_000, 100_000), help='e.g. 10000 100000 1000000')
+    parser.add_argument('--impl', nargs='+', choices=IMPLEMENTATIONS, default=list(IMPLEMENTATIONS))
+    parser.add_argument('--state-size', type=int, default=2)
+    parser.add_argument('--maxlen', type=int, default=256)
+    parser.add_argument('--generate', type=int, default=1000, help='chains generated per measurement')
+    parser.add_argument('--vocab', type=int, default=50_000, help='synthetic vocabulary size')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    if args.corpus:
+        corpus = read_corpus(args.corpus, max(args.sizes))
+    else:
+        corpus = synthetic_corpus(max(args.sizes), args.vocab, args.seed)
+    print(f'{"impl":<8} {"messages":>9} {"states":>9} {"learn msg/s":>11} {"gen mean us":>11} '
+          f'{"gen p95 us":>10} {"gen words":>9} {"unlearn us":>10} {"MiB":>8} {"B/state":>8} {"B/word":>7}')
+    for size in sorted(args.sizes):
+        messages = corpus[:size]
+        for name in args.impl:
+            res = measure(IMPLEMENTATIONS[name], messages, args)
+            print(f'{name:<8} {res["messages"]:>9d} {res["states"]:>9d} {res["messages"] / res["learn_s"]:>11.0f} '
+                  f'{res["gen_mean_us"]:>11.1f} {res["gen_p95_us"]:>10.1f} {res["gen_words"]:>9.1f} '
+                  f'{res["unlearn_us"]:>10.1f} {res["bytes"] / 2 ** 20:>8.1f} '
+                  f'{res["bytes"] / res["states"]:>8.1f} {res["bytes"] / res["words"]:>7.1f}')
+        if len(messages) < size:
+            print(f'Corpus only has {len(messages)} messages', file=sys.stderr)
+            break
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# PikalaxBOT - A Discord bot in discord.py
+# Copyright (C) 2018-2021  PikalaxALT
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Q20 parser benchmark and regression check.
+
+Runs every question in the corpus against a fixed set of solutions
+using the local PokeAPI database, with no Discord connection. Reports
+latency per parse method and per question, the number of SQL
+statements each question ran, and compares every answer against the
+golden file. Exits nonzero if any answer changed.
+
+Answers depend on the PokeAPI build, so the golden file isn't shipped.
+Record it with --update-golden from a revision whose answers you trust,
+against the same database, before changing the parser.
+
+usage: python3 -m benchmarks.q20 [--update-golden] [--repeat N] [--verbose]
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import asyncio
+import argparse
+import statistics
+from collections import defaultdict
+
+from pikalaxbot.pokeapi import PokeapiModel, methods
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(os.path.dirname(BENCHDIR), 'pokeapi', 'db.sqlite3')
+DEFAULT_CORPUS = os.path.join(BENCHDIR, 'q20_questions.txt')
+DEFAULT_GOLDEN = os.path.join(BENCHDIR, 'q20_golden.json')
+
+# Bulbasaur, Charmander, Pikachu, Magikarp, Eevee, Mewtwo, Tyranitar,
+# Deoxys, Arceus, Greninja
+DEFAULT_SOLUTIONS = (1, 4, 25, 129, 133, 150, 248, 386, 493, 658)
+
+
+def read_corpus(path: str, samples: tuple[str, ...]) -> list[str]:
+    questions = list(samples)
+    with open(path, encoding='utf-8') as fp:
+        for line in fp:
+            line = line.strip()
+            if line and not line.startswith('#') and line not in questions:
+                questions.append(line)
+    return questions
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def run(args) -> int:
+    db, classes = await methods.open_pokeapi(f'file:{args.database}?mode=ro')
+    PokeapiModel.swap(db, classes)
+    # The cog's annotations need the models to exist
+    from pikalaxbot.cogs import q20_game
+
+    statements = 0
+
+    def trace(sql: str):
+        nonlocal statements
+        statements += 1
+
+    await db.set_trace_callback(trace)
+    bot = types.SimpleNamespace(pokeapi=db, emojis=[], log_debug=lambda *a, **kw: None)
+    game = types.SimpleNamespace(bot=bot, challenge_mode=False, _solution=None)
+    parser = q20_game.Q20QuestionParser(bot)
+    questions = read_corpus(args.corpus, q20_game.Q20GameObject._sample_questions)
+
+    answers: dict[str, list] = {}
+    method_times: defaultdict[str, list[float]] = defaultdict(list)
+    question_times: list[float] = []
+    query_counts: list[int] = []
+    for solution_id in args.solutions:
+        game._solution = await classes.PokemonSpecies.get(solution_id)
+        if game._solution is None:
+            print(f'No species with id {solution_id}', file=sys.stderr)
+            return 2
+        for question in questions:
+            for i in range(args.repeat):
+                before = statements
+                start = time.perf_counter()
+                timings = {}
+                message, res, valid, _mask = await parser.parse(game, question, timings)
+                question_times.append(time.perf_counter() - start)
+                for name, elapsed in timings.items():
+                    method_times[name].append(elapsed)
+                if i == 0:
+                    query_counts.append(statements - before)
+                    answers[f'{solution_id}:{question}'] = [message, res, valid]
+                    if args.verbose:
+                        print(f'{solution_id:>4d} {question_times[-1] * 1000:8.2f}ms '
+                              f'{statements - before:>4d}q  {question!r} -> {message!r}')
+    await db.close()
+
+    print(f'{len(answers)} questions x {args.repeat}, {sum(query_counts)} SQL statements on first pass')
+    print(f'{"method":<16} {"calls":>6} {"mean ms":>9} {"p95 ms":>9} {"max ms":>9}')
+    for name, times in sorted(method_times.items(), key=lambda t: -sum(t[1])):
+        print(f'{name:<16} {len(times):>6d} {statistics.fmean(times) * 1000:>9.3f} '
+              f'{percentile(times, 0.95) * 1000:>9.3f} {max(times) * 1000:>9.3f}')
+    print(f'{"(question)":<16} {len(question_times):>6d} {statistics.fmean(question_times) * 1000:>9.3f} '
+          f'{percentile(question_times, 0.95) * 1000:>9.3f} {max(question_times) * 1000:>9.3f}')
+    print(f'queries per question: mean {statistics.fmean(query_counts):.1f}, max {max(query_counts)}')
+
+    if args.update_golden:
+        with open(args.golden, 'w', encoding='utf-8') as fp:
+            json.dump(answers, fp, indent=1, sort_keys=True)
+        print(f'Wrote {len(answers)} answers to {args.golden}')
+        return 0
+    try:
+        with open(args.golden, encoding='utf-8') as fp:
+            golden = json.load(fp)
+    except FileNotFoundError:
+        print(f'No golden file at {args.golden}. Record one with --update-golden '
+              f'on a known-good revision against this database first.', file=sys.stderr)
+        return 1
+    changed = 0
+    for key in sorted(golden.keys() | answers.keys()):
+        if golden.get(key) != answers.get(key):
+            changed += 1
+            print(f'CHANGED {key}\n  golden: {golden.get(key)}\n  now:    {answers.get(key)}')
+    print(f'{changed} answer(s) differ from the golden file')
+    return 1 if changed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Q20 question parser')
+    parser.add_argument('--database', default=DEFAULT_DB)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--golden', default=DEFAULT_GOLDEN)
+    parser.add_argument('--solutions', type=int, nargs='+', default=DEFAULT_SOLUTIONS)
+    parser.add_argument('--repeat', type=int, default=3, help='parses per question, for latency')
+    parser.add_argument('--update-golden', action='store_true', help='record the current answers as correct')
+    parser.add_argument('--verbose', '-v', action='store_true', help='print every question and answer')
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
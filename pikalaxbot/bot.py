@@ -25,6 +25,7 @@ import datetime
 from .utils.logging_mixin import BotLogger
 from .context import MyContext
 from .utils.config_io import Settings
+from .utils.history import HistoryScheduler
 import asyncstdlib.functools as afunctools
 from .pokeapi import methods, PokeapiModel
 import asqlite3
@@ -60,10 +61,15 @@ class PikalaxBOT(BotLogger, commands.Bot):
         # PokeAPI
         self._pokeapi_file = pokeapi_file
         self._pokeapi: typing.Optional[asqlite3.Connection] = self.loop.run_until_complete(methods.make_pokeapi(self))
+        # Closes of connections replaced by a hot swap
+        self._pokeapi_retiring: set[asyncio.Task] = set()
 
         # SQL
         self.__tables__: list[type[BaseTable]] = []
 
+        # Shared channel history fetches
+        self.history_scheduler = HistoryScheduler()
+
     @property
     def command_error_emoji(self) -> discord.Emoji:
         return discord.utils.get(self.emojis, name=self.settings.error_emoji)
@@ -123,6 +129,8 @@ class PikalaxBOT(BotLogger, commands.Bot):
                 pass
             if self._pokeapi:
                 await self._pokeapi.close()
+            await asyncio.gather(*methods.cancel_retirements(self), return_exceptions=True)
+            self.history_scheduler.close()
 
     async def on_ready(self):
         self.log_info('Logged in as %s', self.user)
@@ -14,18 +14,76 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from collections import defaultdict, Counter
+from collections import Counter
 import discord
+import asyncio
 import datetime
 from discord.ext import commands, tasks
 from . import *
+from ..utils.history import HistoryPriority
 import typing
 import io
 import time
+import numpy as np
 import matplotlib.pyplot as plt
 from jishaku.functools import executor_function
 
 
+class CDIWindow:
+    """The last size per-minute samples of a channel and the CDI after
+    each, in ring buffers. The linearly weighted sum of the samples is
+    updated as they come in rather than recomputed."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.samples = np.zeros(size)
+        self.cdis = np.zeros(size, dtype=np.int64)
+        self.count = 0
+        # Index of the next sample to be overwritten
+        self._head = 0
+        self._total = 0.
+        self._weighted = 0.
+
+    def __len__(self):
+        return self.count
+
+    def push(self, sample: float):
+        if self.count < self.size:
+            # Weights run 1 (oldest) .. count (newest)
+            self.count += 1
+            self._weighted += self.count * sample
+        else:
+            # Every weight drops by one, which takes the oldest out
+            self._weighted += self.size * sample - self._total
+            self._total -= self.samples[self._head]
+        self._total += sample
+        self.samples[self._head] = sample
+        self.cdis[self._head] = ChatDeathIndex.to_cdi(self.average)
+        self._head = (self._head + 1) % self.size
+        if self._head == 0:
+            # Start each lap from exact sums so rounding can't build up
+            samples = self.ordered(self.samples)
+            self._total = float(samples.sum())
+            self._weighted = float(np.arange(1, self.count + 1) @ samples)
+
+    def ordered(self, ring: np.ndarray) -> np.ndarray:
+        """The filled part of ring, oldest first."""
+        if self.count < self.size:
+            return ring[:self.count]
+        return np.concatenate((ring[self._head:], ring[:self._head]))
+
+    @property
+    def average(self) -> float:
+        n = self.count
+        if n == 0:
+            return 0.
+        return 2 * self._weighted / (n * (n + 1))
+
+    @property
+    def cdi_history(self) -> np.ndarray:
+        return self.ordered(self.cdis)
+
+
 class ChatDeathIndex(BaseCog):
     """Commands for displaying the chat death index of a given channel."""
 
@@ -34,15 +92,16 @@ class ChatDeathIndex(BaseCog):
 
     def __init__(self, bot):
         super().__init__(bot)
-        self.cdi_samples: dict[discord.TextChannel, list[float]] = defaultdict(list)
-        self.calculations: dict[discord.TextChannel, list[int]] = defaultdict(list)
-        self.cumcharcount: Counter[discord.TextChannel] = Counter()
+        # Keyed by channel id, for readable text channels only
+        self.windows: dict[int, CDIWindow] = {}
+        self.cumcharcount: Counter[int] = Counter()
 
     @executor_function
     def plot(self, channels: frozenset[discord.TextChannel], buffer: typing.BinaryIO):
         plt.figure()
         for channel in channels:
-            samples = self.calculations[channel]
+            window = self.windows.get(channel.id)
+            samples = window.cdi_history if window is not None else []
             plt.plot(list(range(1 - len(samples), 1)), samples, label=f'#{channel}')
         plt.xlabel('Minutes ago')
         plt.ylabel('CDI')
@@ -68,45 +127,43 @@ class ChatDeathIndex(BaseCog):
 
     @tasks.loop(seconds=60)
     async def save_message_count(self):
-        for channel in self.bot.get_all_channels():
-            self.cdi_samples[channel].append(self.cumcharcount[channel])
-            self.cdi_samples[channel] = self.cdi_samples[channel][-ChatDeathIndex.MAX_SAMPLES:]
-            self.calculations[channel].append(ChatDeathIndex.samples_to_cdi(self.cdi_samples[channel]))
-            self.calculations[channel] = self.calculations[channel][-ChatDeathIndex.MAX_SAMPLES:]
-            self.cumcharcount[channel] = 0
-
-    def account_for_message(self, channel: discord.TextChannel, start: datetime.datetime):
-        def inner(message: discord.Message):
-            idx = int((message.created_at - start).total_seconds()) // 60
-            self.cdi_samples[channel][idx] += ChatDeathIndex.get_message_cdi_effect(message)
-        return inner
+        for channel_id, window in self.windows.items():
+            window.push(self.cumcharcount.pop(channel_id, 0.))
 
     async def init_channel(self, channel: discord.TextChannel, now: datetime.datetime):
+        if not ChatDeathIndex.can_get_messages(channel):
+            self.windows.pop(channel.id, None)
+            return
+        # Enough minutes before now to fill both the samples and the CDI history
         start = now - datetime.timedelta(minutes=2 * ChatDeathIndex.MAX_SAMPLES - 1)
-        if ChatDeathIndex.can_get_messages(channel):
-            self.cdi_samples[channel] = [0. for _ in range(2 * ChatDeathIndex.MAX_SAMPLES - 1)]
-            await channel.history(
-                before=now,
-                after=start
-            ).filter(
-                self.msg_counts_against_chat_death
-            ).map(
-                self.account_for_message(channel, start)
-            ).flatten()
-            self.calculations[channel] = [ChatDeathIndex.samples_to_cdi(
-                    self.cdi_samples[channel][i:i + ChatDeathIndex.MAX_SAMPLES]
-                ) for i in range(ChatDeathIndex.MAX_SAMPLES)]
-        self.cdi_samples[channel] = self.cdi_samples[channel][-ChatDeathIndex.MAX_SAMPLES:]
-        self.cumcharcount[channel] = 0
+        samples = np.zeros(2 * ChatDeathIndex.MAX_SAMPLES - 1)
+        for message in await self.bot.history_scheduler.fetch(
+            channel,
+            before=now,
+            after=start,
+            priority=HistoryPriority.WARMUP
+        ):
+            if await self.msg_counts_against_chat_death(message):
+                idx = int((message.created_at - start).total_seconds()) // 60
+                samples[idx] += ChatDeathIndex.get_message_cdi_effect(message)
+        window = CDIWindow(ChatDeathIndex.MAX_SAMPLES)
+        for sample in samples:
+            window.push(sample)
+        self.windows[channel.id] = window
+        self.cumcharcount.pop(channel.id, None)
 
     @save_message_count.before_loop
     async def start_message_count(self):
         await self.wait_until_ready()
 
-        now = datetime.datetime.now()
-        for guild in self.bot.guilds:  # type: discord.Guild
-            for channel in guild.text_channels:
-                await self.init_channel(channel, now)
+        # message.created_at is naive UTC
+        now = datetime.datetime.utcnow()
+        # Queued together so the scheduler can order them behind other fetches
+        await asyncio.gather(*(
+            self.init_channel(channel, now)
+            for guild in self.bot.guilds
+            for channel in guild.text_channels
+        ))
 
     @save_message_count.error
     async def save_message_error(self, error):
@@ -116,20 +173,9 @@ class ChatDeathIndex(BaseCog):
     def to_cdi(avg: float):
         return round((avg - 64) ** 2 * 2.3) * ((-1) ** (avg >= 64))
 
-    @staticmethod
-    def accumulate(samples: list[float]):
-        n = len(samples)
-        if n == 0:
-            return 0.
-        return 2 * sum((i + 1) * x for i, x in enumerate(samples)) / (n * (n + 1))
-
-    @staticmethod
-    def samples_to_cdi(samples: list[float]):
-        return ChatDeathIndex.to_cdi(ChatDeathIndex.accumulate(samples))
-
     @BaseCog.listener()
     async def on_message(self, message: discord.Message):
-        if await self.msg_counts_against_chat_death(message):
+        if message.channel.id in self.windows and await self.msg_counts_against_chat_death(message):
             self.cumcharcount[message.channel.id] += ChatDeathIndex.get_message_cdi_effect(message)
 
     @commands.command(name='cdi')
@@ -137,12 +183,11 @@ class ChatDeathIndex(BaseCog):
         """Returns the Chat Death Index of the given channel (if not specified, uses the current channel)"""
 
         channel = channel or ctx.channel
-        chat_avg = self.cdi_samples[channel]
-        n = len(chat_avg)
-        if n < ChatDeathIndex.MIN_SAMPLES:
+        window = self.windows.get(channel.id)
+        if window is None or len(window) < ChatDeathIndex.MIN_SAMPLES:
             await ctx.send(f'I cannot determine the Chat Death Index of {channel.mention} at this time.')
         else:
-            accum = ChatDeathIndex.accumulate(chat_avg)
+            accum = window.average
             cdi = ChatDeathIndex.to_cdi(accum)
             await ctx.send(f'Current Chat Death Index of {channel.mention}: {cdi} ({accum:.3f})')
 
@@ -171,6 +216,29 @@ class ChatDeathIndex(BaseCog):
 
     @BaseCog.listener()
     async def on_guild_join(self, guild: discord.Guild):
-        now = datetime.datetime.now()
+        now = datetime.datetime.utcnow()
         for channel in guild.text_channels:
             await self.init_channel(channel, now)
+
+    @BaseCog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        for channel in guild.channels:
+            self.windows.pop(channel.id, None)
+            self.cumcharcount.pop(channel.id, None)
+
+    @BaseCog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        if ChatDeathIndex.can_get_messages(channel):
+            self.windows[channel.id] = CDIWindow(ChatDeathIndex.MAX_SAMPLES)
+
+    @BaseCog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.windows.pop(channel.id, None)
+        self.cumcharcount.pop(channel.id, None)
+
+    @BaseCog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        if not ChatDeathIndex.can_get_messages(after):
+            self.windows.pop(after.id, None)
+        elif after.id not in self.windows:
+            await self.init_channel(after, datetime.datetime.utcnow())
@@ -14,18 +14,26 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import re
+import heapq
+import pickle
 import typing
 import asyncio
 import operator
+import concurrent.futures
+from array import array
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 from . import *
-from .utils.markov import Chain
+from .utils.markov import Chain, ChainWorker
+from .utils.bloom import CountingBloomFilter
+from ..paths import __dirname__
+from ..utils.history import HistoryPriority
 
-from sqlalchemy import Column, ForeignKey, UniqueConstraint, TEXT, BIGINT, INTEGER, BOOLEAN, select, inspect
+from sqlalchemy import Column, ForeignKey, UniqueConstraint, TEXT, BIGINT, INTEGER, BOOLEAN, select, inspect, text
 from sqlalchemy.orm import relationship, InstanceState
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
@@ -34,6 +42,7 @@ class MarkovConfig(BaseTable):
     guild_id = Column(BIGINT, primary_key=True)
     maxlen = Column(INTEGER, default=256)
     on_mention = Column(BOOLEAN, default=True)
+    state_size = Column(INTEGER, default=2)
 
     channels = relationship('MarkovChannels', backref='config', cascade='all, delete-orphan', lazy='selectin')
     triggers = relationship('MarkovTriggers', backref='config', cascade='all, delete-orphan', lazy='selectin')
@@ -55,6 +64,72 @@ class MarkovTriggers(BaseTable):
     __table_args__ = (UniqueConstraint(guild_id, trigger),)
 
 
+# Messages learned per channel on a cold start
+HISTORY_LIMIT = 5000
+# Words of learned text kept per guild, past which the oldest messages are forgotten
+TOKEN_BUDGET = 250_000
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__dirname__), 'markov')
+# Bump whenever the layout of the snapshot or of Chain changes
+SNAPSHOT_VERSION = 3
+# Longest state a guild can configure
+MAX_STATE_SIZE = 3
+# Chance that a new message is mistaken for one already learned
+DEDUPE_FP_RATE = 0.001
+# Above this many triggers, merge their common prefixes in the pattern
+TRIE_TRIGGER_THRESHOLD = 32
+
+
+def trie_pattern(words: typing.Iterable[str]) -> str:
+    """A regex matching any of words, with shared prefixes matched only
+    once so the engine doesn't retry every word at each position."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        if '' in node:
+            return '(?:{})?'.format('|'.join(alternatives))
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:{})'.format('|'.join(alternatives))
+
+    return build(trie)
+
+
+def unpack_tokens(data: bytes) -> array:
+    token_ids = array('I')
+    token_ids.frombytes(data)
+    return token_ids
+
+
+def rebuild_chain(old: Chain, logs: dict[int, dict[int, bytes]]) -> tuple[Chain, dict[int, dict[int, bytes]]]:
+    """Learn the logged messages into a fresh chain, so it only interns
+    the tokens they use. Returns the chain and the logs re-encoded for it."""
+    chain = Chain(old.state_size, store_lowercase=old.store_lowercase)
+    new_logs = {}
+    for channel_id, log in logs.items():
+        new_log = new_logs[channel_id] = {}
+        for message_id, data in log.items():
+            token_ids = chain.intern_list(old.decode(unpack_tokens(data)))
+            chain.learn_token_ids(token_ids)
+            new_log[message_id] = token_ids.tobytes()
+    return chain, new_logs
+
+
+def write_snapshot(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as fp:
+        fp.write(data)
+    os.replace(tmp, path)
+
+
 class MarkovNoInit(commands.CheckFailure):
     pass
 
@@ -73,28 +148,219 @@ class MarkovManager:
         self._init_fail = False
         self._config: typing.Optional[MarkovConfig] = None
         self._chain: typing.Optional[Chain] = None
-        self._stored_msgs: set[str] = set()
+        # Contents of learned messages, to avoid repeating one verbatim
+        self._stored_msgs = CountingBloomFilter(HISTORY_LIMIT, DEDUPE_FP_RATE)
         self._init_lock = asyncio.Lock()
         self._learned: dict[discord.TextChannel, typing.Optional[bool]] = {}
+        # channel id -> {message id: the chain's token ids, as packed uint32}
+        # for every learned message. Persisted with the chain so restarts
+        # only fetch what's new.
+        self._messages: dict[int, dict[int, bytes]] = {}
+        self._dirty = False
+        # Chain updates waiting to be handed to the worker in one job
+        self._batch: list[tuple[typing.Callable[[array], None], array]] = []
+        # Bumped whenever the configured triggers may have changed
+        self._triggers_version = 0
+        self._trigger_cache: tuple[tuple, frozenset[str], typing.Optional[re.Pattern]] = ((), frozenset(), None)
+        # Kept in step with _config.channels for the message listeners
+        self._channel_ids: frozenset[int] = frozenset()
+        # Words in the message log, and (message id, channel id) of every
+        # learned message, oldest first. Entries for forgotten messages are
+        # skipped when they come up.
+        self._token_count = 0
+        self._age: list[tuple[int, int]] = []
+        # Words forgotten to stay under budget since the chain was last rebuilt
+        self._evicted = 0
 
     async def learn_channel(self, channel: discord.TextChannel):
         if channel in self._learned and self._learned[channel] is not None:
             return
         self._learned[channel] = False
-        await channel.history(limit=5000).map(self.learn).flatten()
+        fetch = self.cog.bot.history_scheduler.fetch
+        if log := self._messages.get(channel.id):
+            # The snapshot is good enough to answer with while catching up
+            self._learned[channel] = True
+            high_water = max(log)
+            messages = await fetch(
+                channel,
+                limit=HISTORY_LIMIT,
+                after=discord.Object(high_water),
+                priority=HistoryPriority.BACKFILL
+            )
+            if len(messages) < HISTORY_LIMIT:
+                # Everything since the snapshot. Its own window is walked
+                # in full, since it also holds messages we never logged.
+                window = await fetch(
+                    channel,
+                    after=discord.Object(min(log) - 1),
+                    before=discord.Object(high_water + 1),
+                    priority=HistoryPriority.BACKFILL
+                )
+                for message in messages:
+                    self.learn(message)
+                self.reconcile_channel(channel.id, high_water, window)
+                self.trim_channel(channel.id)
+                return
+            # Too far behind to be worth patching up
+            self.forget_channel(channel.id)
+        else:
+            messages = await fetch(channel, limit=HISTORY_LIMIT, priority=HistoryPriority.BACKFILL)
+        for message in messages:
+            self.learn(message)
         self._learned[channel] = True
 
+    def reconcile_channel(self, channel_id: int, high_water: int, messages: list[discord.Message]):
+        """Apply edits and deletes to snapshotted messages made while we
+        weren't listening."""
+        log = self._messages.get(channel_id, {})
+        current = {message.id: message for message in messages}
+        for message_id in [message_id for message_id in log if message_id <= high_water]:
+            message = current.get(message_id)
+            if message is None:
+                self.forget_id(channel_id, message_id)
+            elif message.clean_content.split() != self._decode(log[message_id]):
+                self.relearn_message(message)
+
     def prepare(self):
-        self._chain = Chain(store_lowercase=True)
-        self._stored_msgs.clear()
+        if not self.load_snapshot():
+            self._chain = Chain(self.state_size, store_lowercase=True)
+            self._messages = {}
+        self.rebuild_stored_msgs()
+        self.reindex()
         for ch, confch in zip(list(self.channels), list(self._config.channels)):
             if ch.permissions_for(self.guild.me).read_message_history:
                 asyncio.create_task(self.learn_channel(ch))
             else:
                 self.cog.log_warning('Markov: Removing channel %s (%d) due to missing permissions', ch, ch.id)
                 self._config.channels.remove(confch)
+        self._update_channel_ids()
+        for channel_id in set(self._messages) - self._channel_ids:
+            self.forget_channel(channel_id)
         self._initialized = True
 
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(SNAPSHOT_DIR, f'{self.guild.id}.pickle')
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    def load_snapshot(self) -> bool:
+        try:
+            with open(self.snapshot_path, 'rb') as fp:
+                snapshot = pickle.load(fp)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            self.cog.log_warning('Markov: Ignoring unreadable snapshot for guild %d: %s', self.guild.id, e)
+            return False
+        if snapshot.get('version') != SNAPSHOT_VERSION or snapshot['chain'].state_size != self.state_size:
+            return False
+        self._chain = snapshot['chain']
+        self._messages = snapshot['messages']
+        return True
+
+    def rebuild_stored_msgs(self):
+        contents = [' '.join(self._decode(data)) for log in self._messages.values() for data in log.values()]
+        self._stored_msgs = CountingBloomFilter.from_iterable(
+            contents,
+            max(HISTORY_LIMIT, 2 * len(contents)),
+            DEDUPE_FP_RATE
+        )
+
+    def snapshot(self) -> dict[str, typing.Any]:
+        """The state to pickle. Flushes pending chain updates first, so
+        pickling on the worker sees the chain match the message log."""
+        self.flush()
+        self._dirty = False
+        return {
+            'version': SNAPSHOT_VERSION,
+            'chain': self._chain,
+            'messages': {channel_id: dict(log) for channel_id, log in self._messages.items()},
+        }
+
+    def reindex(self):
+        self._token_count = 0
+        self._age = []
+        for channel_id, log in self._messages.items():
+            for message_id, data in log.items():
+                self._token_count += len(data) // 4
+                self._age.append((message_id, channel_id))
+        heapq.heapify(self._age)
+
+    def enforce_budget(self):
+        while self._token_count > TOKEN_BUDGET and self._age:
+            message_id, channel_id = heapq.heappop(self._age)
+            data = self._messages.get(channel_id, {}).get(message_id)
+            if data is not None:
+                self._evicted += len(data) // 4
+                self.forget_id(channel_id, message_id)
+
+    @property
+    def needs_compaction(self):
+        # The corpus has turned over, so most interned tokens are dead weight
+        return self._evicted > TOKEN_BUDGET
+
+    async def compact(self):
+        """Rebuild the chain from the message log on the worker. Messages
+        learned or forgotten in the meantime are patched in afterwards."""
+        self.flush()
+        old_chain = self._chain
+        logs = {channel_id: dict(log) for channel_id, log in self._messages.items()}
+        evicted = self._evicted
+        chain, new_logs = await self.cog.markov_worker.run(rebuild_chain, old_chain, logs)
+        if self._chain is not old_chain:
+            # Relearned for a new state size while the worker was busy
+            return
+        self._chain = chain
+        self._evicted -= evicted
+        self._dirty = True
+        for channel_id, log in self._messages.items():
+            old_log = logs.get(channel_id, {})
+            new_log = new_logs.get(channel_id, {})
+            for message_id, data in log.items():
+                if old_log.get(message_id) is data:
+                    log[message_id] = new_log.pop(message_id)
+                else:
+                    token_ids = chain.intern_list(old_chain.decode(unpack_tokens(data)))
+                    log[message_id] = token_ids.tobytes()
+                    self._update_chain(chain.learn_token_ids, token_ids)
+        # Forgotten, or replaced by an edit, after the rebuild started
+        for new_log in new_logs.values():
+            for data in new_log.values():
+                self._update_chain(chain.unlearn_token_ids, unpack_tokens(data))
+
+    async def stats(self) -> dict[str, int]:
+        self.flush()
+        stats = await self.cog.markov_worker.run(self._chain.stats)
+        stats['messages'] = sum(map(len, self._messages.values()))
+        stats['words'] = self._token_count
+        return stats
+
+    def _decode(self, data: bytes) -> list[str]:
+        return self._chain.decode(unpack_tokens(data))
+
+    def _update_chain(self, fn: typing.Callable[[array], None], token_ids: array):
+        if not self._batch:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self._batch.append((fn, token_ids))
+        self._dirty = True
+
+    @staticmethod
+    def _apply_batch(batch: list[tuple[typing.Callable[[array], None], array]]):
+        for fn, token_ids in batch:
+            fn(token_ids)
+
+    def _batch_done(self, future: concurrent.futures.Future):
+        if (exc := future.exception()) is not None:
+            self.cog.log_tb(None, exc)
+
+    def flush(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self.cog.markov_worker.submit(self._apply_batch, batch).add_done_callback(self._batch_done)
+
     @classmethod
     def from_session(cls, cog: 'Markov', conf: MarkovConfig):
         guild = cog.bot.get_guild(conf.guild_id)
@@ -104,10 +370,10 @@ class MarkovManager:
         return self
 
     @classmethod
-    async def new(cls, cog: 'Markov', guild: discord.Guild, on_mention=True, maxlen=256):
+    async def new(cls, cog: 'Markov', guild: discord.Guild, on_mention=True, maxlen=256, state_size=2):
         self = cls(cog, guild)
         async with cog.sql_session as sess:  # type: AsyncSession
-            self._config = MarkovConfig(guild_id=guild.id, on_mention=on_mention, maxlen=maxlen)
+            self._config = MarkovConfig(guild_id=guild.id, on_mention=on_mention, maxlen=maxlen, state_size=state_size)
             sess.add(self._config)
         # Commit or rollback/raise happens here
         async with self:
@@ -119,6 +385,8 @@ class MarkovManager:
         if state.expired_attributes:
             async with self.cog.sql_session as sess:
                 await sess.refresh(self)
+            self._triggers_version += 1
+            self._update_channel_ids()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -141,9 +409,28 @@ class MarkovManager:
         return [self.guild.get_channel(c.channel_id) for c in self._config.channels]
 
     @property
-    def triggers(self) -> set[str]:
+    def channel_ids(self) -> frozenset[int]:
+        """Ids of the learned channels. Unlike channels, this doesn't need
+        the config to be fresh."""
+        return self._channel_ids
+
+    def _update_channel_ids(self):
+        self._channel_ids = frozenset(c.channel_id for c in self._config.channels)
+
+    def _get_triggers(self) -> tuple[frozenset[str], typing.Optional[re.Pattern]]:
         me = self.guild.me
-        return set(t.trigger.lower() for t in self._config.triggers) | {me.name.lower(), me.display_name.lower()}
+        key = (self._triggers_version, me.name, me.display_name, self.on_mention)
+        cached_key, triggers, pattern = self._trigger_cache
+        if key != cached_key:
+            triggers = frozenset(t.trigger.lower() for t in self._config.triggers) \
+                | {me.name.lower(), me.display_name.lower()}
+            pattern = self._compile_trigger_pattern(triggers)
+            self._trigger_cache = key, triggers, pattern
+        return triggers, pattern
+
+    @property
+    def triggers(self) -> frozenset[str]:
+        return self._get_triggers()[0]
 
     @property
     def maxlen(self):
@@ -161,52 +448,130 @@ class MarkovManager:
     def on_mention(self, value: bool):
         self._config.on_mention = value
 
+    @property
+    def state_size(self):
+        return self._config.state_size
+
+    @state_size.setter
+    def state_size(self, value: int):
+        if value != self._config.state_size:
+            self._config.state_size = value
+            self.relearn()
+
     @property
     def initialized(self):
         return self._initialized and not self._init_fail and any(self._learned.values())
 
     def learn(self, message: discord.Message):
-        self._stored_msgs.add(message.clean_content)
-        self._chain.learn_str(message.clean_content)
+        log = self._messages.setdefault(message.channel.id, {})
+        if message.id in log:
+            return
+        tokens = message.clean_content.split()
+        # Interned here, so the worker only ever reads the vocabulary
+        token_ids = self._chain.intern_list(tokens)
+        log[message.id] = token_ids.tobytes()
+        self._stored_msgs.add(' '.join(tokens))
+        if len(self._stored_msgs) > self._stored_msgs.capacity:
+            self.rebuild_stored_msgs()
+        self._update_chain(self._chain.learn_token_ids, token_ids)
+        self._token_count += len(token_ids)
+        heapq.heappush(self._age, (message.id, message.channel.id))
+        if len(self._age) > 2 * len(self._stored_msgs) + HISTORY_LIMIT:
+            self.reindex()
+        self.enforce_budget()
+
+    def forget_id(self, channel_id: int, message_id: int):
+        data = self._messages.get(channel_id, {}).pop(message_id, None)
+        if data is not None:
+            token_ids = unpack_tokens(data)
+            self._update_chain(self._chain.unlearn_token_ids, token_ids)
+            self._stored_msgs.discard(' '.join(self._chain.decode(token_ids)))
+            self._token_count -= len(token_ids)
+
+    def has_learned(self, channel_id: int, message_id: int) -> bool:
+        return message_id in self._messages.get(channel_id, ())
+
+    def relearn_message(self, message: discord.Message):
+        """Replace what was learned from message with its current content,
+        e.g. after an edit."""
+        self.forget(message)
+        self.learn(message)
+
+    def relearn(self):
+        """Rebuild the chain from the message log, e.g. after the state
+        size changes."""
+        self.flush()
+        old_chain, self._chain = self._chain, Chain(self.state_size, store_lowercase=True)
+        self._evicted = 0
+        for log in self._messages.values():
+            for message_id, data in log.items():
+                token_ids = self._chain.intern_list(old_chain.decode(unpack_tokens(data)))
+                log[message_id] = token_ids.tobytes()
+                self._update_chain(self._chain.learn_token_ids, token_ids)
 
     def forget(self, message: discord.Message):
-        self._chain.unlearn_str(message.clean_content)
-        self._stored_msgs.discard(message.clean_content)
-
-    def generate(self, *, n_attempts=5):
+        self.forget_id(message.channel.id, message.id)
+
+    def forget_channel(self, channel_id: int):
+        for message_id in list(self._messages.get(channel_id, ())):
+            self.forget_id(channel_id, message_id)
+        self._messages.pop(channel_id, None)
+
+    def trim_channel(self, channel_id: int):
+        log = self._messages.get(channel_id, {})
+        for message_id in sorted(log)[:-HISTORY_LIMIT]:
+            self.forget_id(channel_id, message_id)
+
+    async def generate(self, *, n_attempts=5, seed: str = None):
+        self.flush()
+        maxlen = self.maxlen
+        attempts = await self.cog.markov_worker.run(self._generate, self._chain, maxlen, n_attempts, seed)
+        # The dedupe filter is only touched here on the loop
         longest = ''
         lng_cnt = 0
-        chain = self._chain
-        if chain:
-            for i in range(n_attempts):
-                cur = chain.generate(self.maxlen)
-                if len(cur) > lng_cnt:
-                    msg = ' '.join(cur)
-                    if i == 0 or msg not in self._stored_msgs:
-                        lng_cnt = len(cur)
-                        longest = msg
-                        if lng_cnt == self.maxlen:
-                            break
+        for i, cur in enumerate(attempts):
+            if len(cur) > lng_cnt:
+                msg = ' '.join(cur)
+                if i == 0 or msg not in self._stored_msgs:
+                    lng_cnt = len(cur)
+                    longest = msg
+                    if lng_cnt == maxlen:
+                        break
         return longest
 
-    @property
-    def trigger_pattern(self):
+    @staticmethod
+    def _generate(chain: Chain, maxlen: int, n_attempts: int, seed: typing.Optional[str]) -> list[list[str]]:
+        if not chain:
+            return []
+        return [chain.generate(maxlen, seed) for _ in range(n_attempts)]
+
+    def _compile_trigger_pattern(self, triggers: frozenset[str]) -> typing.Optional[re.Pattern]:
         def iter_trigger_patterns():
-            if self.triggers:
-                yield r'\b({})\b'.format('|'.join(self.triggers))
+            if triggers:
+                if len(triggers) > TRIE_TRIGGER_THRESHOLD:
+                    yield r'\b{}\b'.format(trie_pattern(triggers))
+                else:
+                    yield r'\b({})\b'.format('|'.join(map(re.escape, triggers)))
             if self.on_mention:
                 yield '<@!{}>'.format(self.cog.bot.user.id)
 
-        return '|'.join(iter_trigger_patterns())
+        pattern = '|'.join(iter_trigger_patterns())
+        return re.compile(pattern, re.I) if pattern else None
+
+    @property
+    def trigger_pattern(self) -> typing.Optional[re.Pattern]:
+        return self._get_triggers()[1]
 
     def add_channel(self, channel: discord.TextChannel):
-        if channel not in self.channels:
+        if channel.id not in self._channel_ids:
             self._config.channels.append(MarkovChannels(channel_id=channel.id))
+            self._update_channel_ids()
             return asyncio.create_task(self.learn_channel(channel))
 
     def del_channel(self, channel: discord.TextChannel):
-        if channel in self.channels:
-            self._config.channels.pop(self.channels.index(channel))
+        if channel.id in self._channel_ids:
+            self._config.channels.remove(discord.utils.get(self._config.channels, channel_id=channel.id))
+            self._update_channel_ids()
             self._learned.pop(channel, None)
             return True
         return False
@@ -214,6 +579,7 @@ class MarkovManager:
     def add_trigger(self, trigger: str):
         if trigger not in self.triggers:
             self._config.triggers.append(MarkovTriggers(trigger=trigger))
+            self._triggers_version += 1
             return True
         return False
 
@@ -221,12 +587,17 @@ class MarkovManager:
         tr = discord.utils.get(self._config.triggers, trigger=trigger)
         if tr is not None:
             self._config.triggers.remove(tr)
+            self._triggers_version += 1
             return True
         return False
 
     async def purge(self):
         async with self.cog.sql_session as sess:
             sess.delete(self._config)
+        try:
+            os.remove(self.snapshot_path)
+        except FileNotFoundError:
+            pass
 
     @staticmethod
     def exists(ctx: MyContext):
@@ -240,7 +611,8 @@ class MarkovManager:
             return False
         async with ctx.cog.markovs[ctx.guild] as mgr:  # type: MarkovManager
             if ctx.command == ctx.cog.markov \
-                    and not ctx.prefix and not re.search(mgr.trigger_pattern, ctx.message.content, re.I):
+                    and not ctx.prefix \
+                    and not (mgr.trigger_pattern and mgr.trigger_pattern.search(ctx.message.content)):
                 return False
             if not mgr.initialized:
                 raise MarkovNoInit
@@ -267,6 +639,8 @@ class Markov(BaseCog):
         self.prefix_reminder_cooldown = commands.CooldownMapping.from_cooldown(1, 600, commands.BucketType.channel)
         self.no_init_error_cooldown = commands.CooldownMapping.from_cooldown(1, 60, commands.BucketType.channel)
         self._typeracers: dict[discord.TextChannel, MyContext] = {}
+        # Owns every guild's chain
+        self.markov_worker = ChainWorker()
 
     async def prepare_once(self):
         await super().prepare_once()
@@ -282,6 +656,34 @@ class Markov(BaseCog):
                 else:
                     self.markovs[mgr.guild] = mgr
 
+    async def init_db(self, sql: AsyncConnection):
+        await super().init_db(sql)
+        # Tables made before state_size existed
+        await sql.execute(text('ALTER TABLE markov_config ADD COLUMN IF NOT EXISTS state_size INTEGER DEFAULT 2'))
+
+    def cog_unload(self):
+        super().cog_unload()
+        for mgr in self.markovs.values():
+            mgr.flush()
+        self.markov_worker.close()
+        for mgr in self.markovs.values():
+            if mgr.dirty:
+                write_snapshot(mgr.snapshot_path, pickle.dumps(mgr.snapshot(), pickle.HIGHEST_PROTOCOL))
+
+    @tasks.loop(minutes=10)
+    async def save_snapshots(self):
+        for mgr in list(self.markovs.values()):
+            if mgr.needs_compaction:
+                await mgr.compact()
+            if mgr.dirty:
+                # The worker is the only thread that touches the chain
+                data = await self.markov_worker.run(pickle.dumps, mgr.snapshot(), pickle.HIGHEST_PROTOCOL)
+                await self.markov_worker.run(write_snapshot, mgr.snapshot_path, data)
+
+    @save_snapshots.error
+    async def save_snapshots_error(self, error: BaseException):
+        await self.send_tb(None, error, origin='Markov.save_snapshots')
+
     async def get_prefix_help_embed(self, ctx: MyContext):
         first_word = ctx.message.content.split()[0]
         mentions = {f'<@{self.bot.user.id}>', f'<@!{self.bot.user.id}>'}
@@ -301,23 +703,34 @@ class Markov(BaseCog):
         """Generate a random word Markov chain."""
         recipient = recipient or ctx.author
         async with self.markovs[ctx.guild] as mgr:
-            chain = mgr.generate(n_attempts=10) or 'An error has occurred.'
+            chain = await mgr.generate(n_attempts=10) or 'An error has occurred.'
         embed = await self.get_prefix_help_embed(ctx)
         if recipient == ctx.author:
             await ctx.reply(chain, embed=embed)
         else:
             await ctx.send(f'{recipient.mention}: {chain}', embed=embed)
 
+    @commands.check(MarkovManager.markovable)
+    @markov.command('seed')
+    async def markov_seed(self, ctx: MyContext, word: str):
+        """Generate a random word Markov chain starting from the given word."""
+        async with self.markovs[ctx.guild] as mgr:
+            chain = await mgr.generate(n_attempts=10, seed=word)
+        await ctx.reply(chain or f'I have nothing to say after {word!r}.')
+
     @commands.check_any(commands.is_owner(), commands.has_permissions(manage_guild=True))
     @markov.command('config')
-    async def markov_init(self, ctx: MyContext, on_mention=True, maxlen=256):
+    async def markov_init(self, ctx: MyContext, on_mention=True, maxlen=256, state_size=2):
         """Create or update guild Markov config"""
+        if not 1 <= state_size <= MAX_STATE_SIZE:
+            return await ctx.reply(f'State size must be between 1 and {MAX_STATE_SIZE}')
         try:
             async with self.markovs[ctx.guild] as mgr:
                 mgr.on_mention = on_mention
                 mgr.maxlen = maxlen
+                mgr.state_size = state_size
         except KeyError:
-            self.markovs[ctx.guild] = await MarkovManager.new(self, ctx.guild, on_mention, maxlen)
+            self.markovs[ctx.guild] = await MarkovManager.new(self, ctx.guild, on_mention, maxlen, state_size)
         await ctx.message.add_reaction('\N{white heavy check mark}')
 
     @commands.check_any(commands.is_owner(), commands.has_permissions(manage_guild=True))
@@ -394,6 +807,35 @@ class Markov(BaseCog):
             channels = mgr.channels
         await ctx.reply(', '.join(map(operator.attrgetter('mention'), channels)))
 
+    @commands.check(MarkovManager.exists)
+    @markov.command('stats')
+    async def markov_stats(self, ctx: MyContext):
+        """Show how big the guild's Markov chain is"""
+        stats = await self.markovs[ctx.guild].stats()
+        embed = discord.Embed(
+            title=f'Markov stats for {ctx.guild}',
+            colour=discord.Colour.blurple()
+        ).add_field(
+            name='Messages',
+            value=f'{stats["messages"]:,}'
+        ).add_field(
+            name='Words',
+            value=f'{stats["words"]:,} / {TOKEN_BUDGET:,}'
+        ).add_field(
+            name='Vocabulary',
+            value=f'{stats["tokens"]:,}'
+        ).add_field(
+            name='States',
+            value=f'{stats["states"]:,}'
+        ).add_field(
+            name='Transitions',
+            value=f'{stats["transitions"]:,}'
+        ).add_field(
+            name='Chain size',
+            value=f'{stats["bytes"] / 2 ** 20:.1f} MiB'
+        )
+        await ctx.reply(embed=embed)
+
     @BaseCog.listener()
     async def on_message(self, msg: discord.Message):
         if msg.author.bot:
@@ -403,9 +845,8 @@ class Markov(BaseCog):
             return
 
         if mgr := self.markovs.get(msg.guild):
-            async with mgr:
-                if msg.channel in mgr.channels:
-                    mgr.learn(msg)
+            if msg.channel.id in mgr.channel_ids:
+                mgr.learn(msg)
 
             ctx.command = self.markov
             try:
@@ -420,17 +861,29 @@ class Markov(BaseCog):
     @BaseCog.listener()
     async def on_message_edit(self, old: discord.Message, new: discord.Message):
         if mgr := self.markovs.get(new.guild):
-            async with mgr:
-                if old.channel in mgr.channels:
-                    mgr.forget(old)
-                    mgr.learn(new)
+            if old.channel.id in mgr.channel_ids:
+                mgr.relearn_message(new)
 
     @BaseCog.listener()
-    async def on_message_delete(self, msg: discord.Message):
-        if mgr := self.markovs.get(msg.guild):
-            async with mgr:
-                if msg.channel in mgr.channels:
-                    mgr.forget(msg)
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # Cached messages are handled by on_message_edit. Messages restored
+        # from a snapshot aren't in the cache.
+        if payload.cached_message is not None or 'content' not in payload.data:
+            return
+        channel = self.bot.get_channel(payload.channel_id)
+        if mgr := self.markovs.get(getattr(channel, 'guild', None)):
+            if not mgr.has_learned(payload.channel_id, payload.message_id):
+                return
+            try:
+                new = await channel.fetch_message(payload.message_id)
+            except discord.HTTPException:
+                return
+            mgr.relearn_message(new)
+
+    @BaseCog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if mgr := self.markovs.get(self.bot.get_guild(payload.guild_id)):
+            mgr.forget_id(payload.channel_id, payload.message_id)
 
     @BaseCog.listener()
     async def on_guild_remove(self, guild: discord.Guild):
@@ -445,7 +898,7 @@ class Markov(BaseCog):
 
         self._typeracers[ctx.channel] = ctx
         async with self.markovs[ctx.guild] as mgr:
-            chain = mgr.generate()
+            chain = await mgr.generate()
 
         chain = re.sub(r'[^\w\d\s]', '', chain)
         chain = re.sub('\s+', ' ', chain)
@@ -494,6 +947,7 @@ class Markov(BaseCog):
             await self.send_tb(ctx, exc)
 
     @markov.error
+    @markov_seed.error
     @typeracer.error
     async def markov_error(self, ctx: MyContext, error: commands.CommandError):
         if isinstance(error, MarkovNoInit) and not self.no_init_error_cooldown.update_rate_limit(ctx.message):
@@ -17,14 +17,17 @@
 import discord
 from discord.ext import commands, tasks, menus
 import asyncio
+import os
 import sqlite3
 import time
 from ..pokeapi import *
+from ..pokeapi.models import tblname_to_classname
 from ..paths import __dirname__
 from textwrap import indent
 import traceback
 import operator
 import aioitertools
+import numpy as np
 from . import *
 import typing
 from collections.abc import Iterable
@@ -144,15 +147,47 @@ class SqlResponseEmbed(menus.ListPageSource):
         )
 
 
+class SearchResultsPageSource(menus.ListPageSource):
+    def __init__(
+            self,
+            title: str,
+            results: typing.Sequence,
+            resolver: typing.Callable[[typing.Sequence], typing.Awaitable[list[str]]]
+    ):
+        super().__init__(results, per_page=20)
+        self.title = title
+        self.resolver = resolver
+
+    async def format_page(self, menu: menus.MenuPages, page: typing.Sequence):
+        names = await self.resolver(page)
+        return discord.Embed(
+            title=self.title,
+            description=', '.join(names),
+            colour=0xf47fff
+        ).set_footer(
+            text=f'Page {menu.current_page + 1}/{self.get_max_pages()} | {len(self.entries)} results'
+        )
+
+
+class SearchCursor(menus.MenuPages):
+    async def finalize(self, timed_out):
+        cursors: dict[int, SearchCursor] = self.ctx.cog._cursors
+        if cursors.get(self.ctx.author.id) is self:
+            del cursors[self.ctx.author.id]
+
+
 class PokeApiCog(BaseCog, name='PokeApi'):
     """Commands relating to the bot's local clone of the PokeAPI database."""
 
     def __init__(self, bot):
         super().__init__(bot)
         self._lock = asyncio.Lock()
+        # Live dexsearch/movesearch results, one per user
+        self._cursors: dict[int, SearchCursor] = {}
 
     def cog_unload(self):
         assert not self._lock.locked(), 'PokeApi is locked'
+        cancel_retirements(self.bot)
 
     async def do_rebuild_pokeapi(self, ctx: MyContext):
         @acm
@@ -174,24 +209,29 @@ class PokeApiCog(BaseCog, name='PokeApi'):
 
         embed = discord.Embed(title='Updating PokeAPI', description='Started', colour=0xf47fff)
         msg = await ctx.send(embed=embed)
-        await self.bot.pokeapi.close()
-        self.bot.pokeapi = None
+        # Build next to the live database so the final rename is atomic.
+        # The current database keeps serving until the swap.
+        live_file = os.path.join(os.path.dirname(__dirname__), 'pokeapi', 'db.sqlite3')
+        new_file = live_file + '.new'
         async with do_typing(msg):
             try:
-                shell = await asyncio.create_subprocess_shell(f'{__dirname__}/../setup_pokeapi.sh')
-                await shell.wait()
-                self.bot.pokeapi = await make_pokeapi(self.bot)
+                shell = await asyncio.create_subprocess_exec(f'{__dirname__}/../setup_pokeapi.sh', new_file)
+                if returncode := await shell.wait():
+                    raise RuntimeError(f'setup_pokeapi.sh exited with status {returncode}')
+                start = time.perf_counter()
+                await hot_swap_pokeapi(self.bot, new_file, live_file)
+                end = time.perf_counter()
             except Exception as e:
                 embed.colour = discord.Colour.red()
                 tb = ''.join(traceback.format_exception(e.__class__, e, e.__traceback__))
                 if len(tb) > 2040:
                     tb = '...\n' + tb[-2036:]
-                embed.title = 'Update failed, pokeapi remains offline'
+                embed.title = 'Update failed, the previous pokeapi is still online'
                 embed.description = f'```\n{tb}\n```'
             else:
                 embed.colour = discord.Colour.green()
                 embed.title = 'Update succeeded!'
-                embed.description = 'You can now use pokeapi again'
+                embed.description = f'Validated and swapped in the new database in {end - start:.1f}s'
         await msg.edit(embed=embed)
 
     @commands.group()
@@ -504,94 +544,74 @@ class PokeApiCog(BaseCog, name='PokeApi'):
         if m := re.match(r'^(g(en)?)? ?([1-8])$', term, flags=re.I):
             gen = int(m[3])
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemonspecies pv2ps on pv2psn.pokemon_species_id = pv2ps.id
+            SELECT pv2ps.id
+            FROM pokemon_v2_pokemonspecies pv2ps
             WHERE pv2ps.generation_id = ?
-            AND pv2psn.language_id = 9
             """, gen
         elif move := await PokeapiModel.classes.Move.get_named(term):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
             INNER JOIN pokemon_v2_pokemonmove pv2pm ON pv2p.id = pv2pm.pokemon_id
-            WHERE pv2psn.language_id = 9
-            AND pv2p.is_default = TRUE
+            WHERE pv2p.is_default = TRUE
             AND pv2pm.move_id = ?
             """, move.id
         elif type_ := await PokeapiModel.classes.Type.get_named(type_pat.sub('', term)):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
             INNER JOIN pokemon_v2_pokemontype pv2pt ON pv2p.id = pv2pt.pokemon_id
-            WHERE pv2psn.language_id = 9
-            AND pv2p.is_default = TRUE
+            WHERE pv2p.is_default = TRUE
             AND pv2pt.type_id = ?
             """, type_.id
         elif ability := await PokeapiModel.classes.Ability.get_named(term):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
             INNER JOIN pokemon_v2_pokemonability pv2pa ON pv2p.id = pv2pa.pokemon_id
-            WHERE pv2psn.language_id = 9
-            AND pv2p.is_default = TRUE
+            WHERE pv2p.is_default = TRUE
             AND pv2pa.ability_id = ?
             """, ability.id
         elif color := await PokeapiModel.classes.PokemonColor.get_named(term):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemonspecies pv2ps ON pv2psn.pokemon_species_id = pv2ps.id
-            WHERE pv2psn.language_id = 9
-            AND pv2ps.pokemon_color_id = ?
+            SELECT pv2ps.id
+            FROM pokemon_v2_pokemonspecies pv2ps
+            WHERE pv2ps.pokemon_color_id = ?
             """, color.id,
         elif egg_group := await PokeapiModel.classes.EggGroup.get_named(egg_group_pat.sub('', term)):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemonegggroup pv2peg ON pv2psn.pokemon_species_id = pv2peg.pokemon_species_id
-            WHERE pv2psn.language_id = 9
-            AND pv2peg.egg_group_id = ?
+            SELECT pv2peg.pokemon_species_id
+            FROM pokemon_v2_pokemonegggroup pv2peg
+            WHERE pv2peg.egg_group_id = ?
             """, egg_group.id
         elif re.match(r'^megas?$', term, re.I):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
             INNER JOIN pokemon_v2_pokemonform pv2pf on pv2p.id = pv2pf.pokemon_id
-            WHERE pv2psn.language_id = 9
-            AND pv2pf.is_mega = TRUE
+            WHERE pv2pf.is_mega = TRUE
             """,
         elif re.match(r'^(mono(type)?|single)$', term, re.I):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
             INNER JOIN pokemon_v2_pokemontype pv2pt ON pv2p.id = pv2pt.pokemon_id
-            WHERE pv2psn.language_id = 9
-            AND pv2p.is_default = TRUE
-            GROUP BY pv2psn.pokemon_species_id
+            WHERE pv2p.is_default = TRUE
+            GROUP BY pv2p.pokemon_species_id
             HAVING COUNT(pv2pt.type_id) = 1
             """,
         elif re.match(r'^g(iganta)?max$', term, re.I):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
             INNER JOIN pokemon_v2_pokemonform pv2pf on pv2p.id = pv2pf.pokemon_id
-            WHERE pv2psn.language_id = 9
-            AND pv2pf.id > 10412
+            WHERE pv2pf.id > 10412
             """,
         elif re.match(r'^(fe|fully ?evolved)$', term, re.I):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemonspecies pv2ps ON pv2psn.pokemon_species_id = pv2ps.id
-            WHERE pv2psn.language_id = 9
-            AND NOT EXISTS (
+            SELECT pv2ps.id
+            FROM pokemon_v2_pokemonspecies pv2ps
+            WHERE NOT EXISTS (
                 SELECT *
                 FROM pokemon_v2_pokemonspecies pv2ps2
                 WHERE pv2ps2.evolves_from_species_id = pv2ps.id
@@ -633,12 +653,10 @@ class PokeApiCog(BaseCog, name='PokeApi'):
             # We use unsafe sql injection here because this is just
             # too complicated to do with args
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
             INNER JOIN pokemon_v2_pokemonstat pv2pst ON pv2p.id = pv2pst.pokemon_id
-            WHERE pv2psn.language_id = 9
-            AND pv2p.is_default = TRUE
+            WHERE pv2p.is_default = TRUE
             AND pv2pst.stat_id = ?
             AND pv2pst.base_stat {} ?
             """.format(m['ineq']), stat_id, m['value']
@@ -646,13 +664,11 @@ class PokeApiCog(BaseCog, name='PokeApi'):
             # We use unsafe sql injection here because this is just
             # too complicated to do with args
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
             INNER JOIN pokemon_v2_pokemonstat pv2pst ON pv2p.id = pv2pst.pokemon_id
-            WHERE pv2psn.language_id = 9
-            AND pv2p.is_default = TRUE
-            GROUP BY pv2psn.pokemon_species_id
+            WHERE pv2p.is_default = TRUE
+            GROUP BY pv2p.pokemon_species_id
             HAVING SUM(pv2pst.base_stat) {} ?
             """.format(m['ineq']), m['value']
         elif m := re.match(
@@ -664,11 +680,9 @@ class PokeApiCog(BaseCog, name='PokeApi'):
                 re.I
         ):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
-            WHERE pv2psn.language_id = 9
-            AND pv2p.is_default = TRUE
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
+            WHERE pv2p.is_default = TRUE
             AND pv2p.{} {} ?
             """.format(m['measure'], m['ineq']), float(m['amount']) * 10
         elif m := re.match(r'^(?P<direction>weak|resists)\s*(?P<type>.+)$', term, re.I):
@@ -691,47 +705,37 @@ class PokeApiCog(BaseCog, name='PokeApi'):
             if is_flying_press:
                 args += (3,)
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemon pv2p ON pv2psn.pokemon_species_id = pv2p.pokemon_species_id
+            SELECT pv2p.pokemon_species_id
+            FROM pokemon_v2_pokemon pv2p
             INNER JOIN pokemon_v2_pokemontype pv2pt ON pv2p.id = pv2pt.pokemon_id
             INNER JOIN pokemon_v2_typeefficacy pv2te ON pv2pt.type_id = pv2te.target_type_id
-            WHERE pv2psn.language_id = 9
-            AND pv2te.damage_type_id {}
-            GROUP BY pv2psn.pokemon_species_id
+            WHERE pv2te.damage_type_id {}
+            GROUP BY pv2p.pokemon_species_id
             HAVING PRODUCT(pv2te.damage_factor / 100.0) {} 1
             """.format('IN (?, ?)' if is_flying_press else '= ?', '>' if m['direction'] == 'weak' else '<'), *args
         elif re.match(r'^legend(ary)?$', term, re.I):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemonspecies pv2ps ON pv2psn.pokemon_species_id = pv2ps.id
-            WHERE pv2psn.language_id = 9
-            AND pv2ps.is_legendary = TRUE
+            SELECT pv2ps.id
+            FROM pokemon_v2_pokemonspecies pv2ps
+            WHERE pv2ps.is_legendary = TRUE
             """,
         elif re.match(r'^bab{1,2}y?$', term, re.I):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemonspecies pv2ps ON pv2psn.pokemon_species_id = pv2ps.id
-            WHERE pv2psn.language_id = 9
-            AND pv2ps.is_baby = TRUE
+            SELECT pv2ps.id
+            FROM pokemon_v2_pokemonspecies pv2ps
+            WHERE pv2ps.is_baby = TRUE
             """,
         elif re.match(r'^(unevolved|basic|first stage)$', term, re.I):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemonspecies pv2ps ON pv2psn.pokemon_species_id = pv2ps.id
-            WHERE pv2psn.language_id = 9
-            AND pv2ps.evolves_from_species_id IS NULL
+            SELECT pv2ps.id
+            FROM pokemon_v2_pokemonspecies pv2ps
+            WHERE pv2ps.evolves_from_species_id IS NULL
             """,
         elif re.match(r'^(evolve[ds])$', term, re.I):
             return """
-            SELECT pv2psn.name
-            FROM pokemon_v2_pokemonspeciesname pv2psn
-            INNER JOIN pokemon_v2_pokemonspecies pv2ps ON pv2psn.pokemon_species_id = pv2ps.id
+            SELECT pv2ps.id
+            FROM pokemon_v2_pokemonspecies pv2ps
             INNER JOIN pokemon_v2_pokemonspecies pv2ps2 ON pv2ps.evolution_chain_id = pv2ps2.evolution_chain_id
-            WHERE pv2psn.language_id = 9
             GROUP BY pv2ps.id
             HAVING COUNT(*) > 1
             """,
@@ -746,7 +750,7 @@ class PokeApiCog(BaseCog, name='PokeApi'):
         for i, real_term in enumerate(terms):
             new_statement, *new_args = await self.ds_parse_one(real_term)
             if i == 0:
-                joiner = """SELECT name FROM pokemon_v2_pokemonspeciesname WHERE language_id = 9 EXCEPT""" \
+                joiner = """SELECT id FROM pokemon_v2_pokemonspecies EXCEPT""" \
                     if real_term.startswith('!') else ''
             else:
                 joiner = 'EXCEPT' if real_term.startswith('!') else 'UNION'
@@ -754,6 +758,30 @@ class PokeApiCog(BaseCog, name='PokeApi'):
             statement += f' {joiner} {new_statement}'
         return statement, args
 
+    async def send_search_results(
+            self,
+            ctx: MyContext,
+            query: list[str],
+            results: typing.Sequence,
+            resolver: typing.Callable[[typing.Sequence], typing.Awaitable[list[str]]]
+    ):
+        if not len(results):
+            return await ctx.send('No results found.')
+        if old_cursor := self._cursors.pop(ctx.author.id, None):
+            old_cursor.stop()
+        title = ', '.join(query)
+        cursor = SearchCursor(
+            SearchResultsPageSource(
+                title if len(title) < 256 else title[:253] + '...',
+                results,
+                resolver
+            ),
+            timeout=120.0,
+            clear_reactions_after=True
+        )
+        self._cursors[ctx.author.id] = cursor
+        await cursor.start(ctx)
+
     @commands.check(dexsearch_check)
     @commands.command(aliases=['ds'], usage='<term[, term[, ...]]>')
     async def dexsearch(self, ctx, *, query: CommaSeparatedArgs):
@@ -762,13 +790,10 @@ class PokeApiCog(BaseCog, name='PokeApi'):
 
         statements = ()
         args = []
-        show_all = False
         async with ctx.typing():
             for fullterm in query:
                 if fullterm.lower() == 'all':
-                    if ctx.guild:
-                        return await ctx.send('Cannot broadcast with "all", try DMs instead')
-                    show_all = True
+                    # Results are paginated now, kept for backwards compatibility
                     continue
                 try:
                     new_statement, new_args = await self.ds_parse(fullterm)
@@ -776,19 +801,11 @@ class PokeApiCog(BaseCog, name='PokeApi'):
                     return await ctx.send(e)
                 statements += f'({new_statement})',
                 args += new_args
-        statement = 'SELECT DISTINCT name FROM ' + ' INTERSECT SELECT * FROM '.join(statements) + ' ORDER BY name'
+        statement = 'SELECT DISTINCT * FROM ' + ' INTERSECT SELECT * FROM '.join(statements) + ' ORDER BY 1'
         self.bot.log_debug(statement)
         self.bot.log_debug(', '.join(map(str, args)))
-        results = [name for name, in await self.bot.pokeapi.execute_fetchall(statement, args)]
-        if not results:
-            await ctx.send('No results found.')
-        elif len(results) > 20 and not show_all:
-            await ctx.send(f'{", ".join(results[:20])}, and {len(results) - 20} more')
-        else:
-            pag = commands.Paginator('', '', max_size=1500)
-            [pag.add_line(name) for name in results]
-            for i, page in enumerate(pag.pages):
-                await ctx.send(page.strip().replace('\n', ', ') + (', ...' if i < len(pag.pages) - 1 else ''))
+        results = [id_ for id_, in await self.bot.pokeapi.execute_fetchall(statement, args)]
+        await self.send_search_results(ctx, query, results, self.bot.pokeapi.species_table.resolve_names)
 
     @dexsearch.error
     async def dexsearch_error(self, ctx: MyContext, exc: commands.CommandError):
@@ -796,113 +813,81 @@ class PokeApiCog(BaseCog, name='PokeApi'):
             exc = exc.original
         await ctx.send(f'{exc.__class__.__name__}: {exc}', delete_after=10)
 
-    async def ms_parse_one(self, fullterm: str) -> tuple:
-        target = None
+    async def ms_lookup(self, table: str, name: str) -> typing.Optional[int]:
+        move_table: MoveTable = self.bot.pokeapi.move_table
+        if (id_ := move_table.lookup(table, name)) is not None:
+            return id_
+        entity = await getattr(PokeapiModel.classes, tblname_to_classname('pokemon_v2_' + table)).get_named(name)
+        return entity and entity.id
+
+    async def ms_parse_one(self, fullterm: str) -> np.ndarray:
+        move_table: MoveTable = self.bot.pokeapi.move_table
         notsearch, term = re.match(r'^(!?)(.+?)$', fullterm).groups()
         if m := re.match(r'^(g(en)?)? ?([1-8])$', term, re.I):
-            gen = int(m[3])
-            return """
-            SELECT pv2mn.name
-            FROM pokemon_v2_movename pv2mn
-            INNER JOIN pokemon_v2_move pv2m on pv2mn.move_id = pv2m.id
-            WHERE pv2m.generation_id = ?
-            AND pv2mn.language_id = 9
-            """, gen
-        elif type_ := await PokeapiModel.classes.Type.get_named(type_pat.sub('', term)):
-            return """
-            SELECT pv2mn.name
-            FROM pokemon_v2_movename pv2mn
-            INNER JOIN pokemon_v2_move pv2m on pv2mn.move_id = pv2m.id
-            WHERE pv2mn.language_id = 9
-            AND pv2m.type_id = ?
-            """, type_.id
-        elif mdclass := await PokeapiModel.classes.MoveDamageClass.get_named(term):
-            return """
-            SELECT pv2mn.name
-            FROM pokemon_v2_movename pv2mn
-            INNER JOIN pokemon_v2_move pv2m on pv2mn.move_id = pv2m.id
-            WHERE pv2mn.language_id = 9
-            AND pv2m.move_damage_class_id = ?
-            """, mdclass.id
-        elif ctype := await PokeapiModel.classes.ContestType.get_named(term):
-            return """
-            SELECT pv2mn.name
-            FROM pokemon_v2_movename pv2mn
-            INNER JOIN pokemon_v2_move pv2m on pv2mn.move_id = pv2m.id
-            WHERE pv2mn.language_id = 9
-            AND pv2m.contest_type_id = ?
-            """, ctype.id
+            return move_table.generation_id == int(m[3])
+        elif m := re.match(
+                r'^(?P<column>power|bp|acc(uracy)?|pp|priority)'
+                r'\s*(?P<ineq>[<>!]?=|[<>])\s*'
+                r'(?P<value>[+-]?\d+)$',
+                term,
+                re.I
+        ):
+            column = {'bp': 'power', 'acc': 'accuracy'}.get(m['column'].lower(), m['column'].lower())
+            return move_table.compare(column, m['ineq'], int(m['value']))
+        elif m := re.match(r'^(learn(ed|able)? by|learnset)\s+(?P<mon>.+)$', term, re.I):
+            mon = await PokeapiModel.classes.PokemonSpecies.get_named(m['mon'])
+            if mon is None:
+                raise DexsearchParseError('No Pokémon named {}'.format(m['mon']))
+            return move_table.learned_by(mon.id)
+        elif (type_id := await self.ms_lookup('type', type_pat.sub('', term))) is not None:
+            return move_table.type_id == type_id
+        elif (mdclass_id := await self.ms_lookup('movedamageclass', term)) is not None:
+            return move_table.move_damage_class_id == mdclass_id
+        elif (ctype_id := await self.ms_lookup('contesttype', term)) is not None:
+            return move_table.contest_type_id == ctype_id
         elif (m := re.match(r'^targets\s+(?P<target>.+)$', term, re.I)) \
-                and (target := await PokeapiModel.classes.MoveTarget.get_named(m['target'])):
-            return """
-            SELECT pv2mn.name
-            FROM pokemon_v2_movename pv2mn
-            INNER JOIN pokemon_v2_move pv2m on pv2mn.move_id = pv2m.id
-            WHERE pv2mn.language_id = 9
-            AND pv2m.move_target_id = ?
-            """, target.id
-        elif attr := await PokeapiModel.classes.MoveAttribute.get_named(
+                and (target_id := await self.ms_lookup('movetarget', m['target'])) is not None:
+            return move_table.move_target_id == target_id
+        elif (attr_id := await self.ms_lookup(
+                'moveattribute',
                 re.sub(r'^bypasses\s*substitute$', 'authentic', term, re.I)
-        ):
-            return """
-            SELECT pv2mn.name
-            FROM pokemon_v2_movename pv2mn
-            INNER JOIN pokemon_v2_moveattributemap p on pv2mn.move_id = p.move_id
-            WHERE pv2mn.language_id = 9
-            AND p.move_attribute_id = ?
-            """, attr.id
+        )) is not None:
+            return move_table.has_attribute(attr_id)
         else:
             raise DexsearchParseError(f'I did not understand your query (first unrecognized term: {fullterm})')
 
-    async def ms_parse(self, term: str):
-        args = []
+    async def ms_parse(self, term: str) -> np.ndarray:
+        move_table: MoveTable = self.bot.pokeapi.move_table
         terms = re.split(r'\s*\|\s*', term)
-        statement = ''
+        mask = move_table.all()
 
         for i, real_term in enumerate(terms):
-            new_statement, *new_args = await self.ms_parse_one(real_term)
-            if i == 0:
-                joiner = """SELECT name FROM pokemon_v2_movename WHERE language_id = 9 EXCEPT""" \
-                    if real_term.startswith('!') else ''
+            new_mask = await self.ms_parse_one(real_term)
+            if real_term.startswith('!'):
+                mask &= ~new_mask
+            elif i == 0:
+                mask = new_mask
             else:
-                joiner = 'EXCEPT' if real_term.startswith('!') else 'UNION'
-            args += new_args
-            statement += f' {joiner} {new_statement}'
-        return statement, args
+                mask |= new_mask
+        return mask
 
     @commands.command(aliases=['ms'], usage='<term[, term[, ...]]>')
     async def movesearch(self, ctx, *, query: CommaSeparatedArgs):
-        """Search the list of moves"""
+        """Search the list of moves. Valid terms: generation, type, damage class, contest type, targets <target>,
+        move attribute, learned by <mon>, power, accuracy, pp, priority"""
 
-        statements = ()
-        args = []
-        show_all = False
+        move_table: MoveTable = self.bot.pokeapi.move_table
+        mask = move_table.all()
         async with ctx.typing():
             for fullterm in query:
                 if fullterm.lower() == 'all':
-                    if ctx.guild:
-                        return await ctx.send('Cannot broadcast with "all", try DMs instead')
-                    show_all = True
+                    # Results are paginated now, kept for backwards compatibility
                     continue
                 try:
-                    new_statement, new_args = await self.ms_parse(fullterm)
+                    mask &= await self.ms_parse(fullterm)
                 except DexsearchParseError as e:
                     return await ctx.send(e)
-                statements += f'({new_statement})',
-                args += new_args
-        statement = 'SELECT DISTINCT name FROM ' + ' INTERSECT SELECT * FROM '.join(statements) + ' ORDER BY name'
-        self.bot.log_debug(statement)
-        self.bot.log_debug(', '.join(map(str, args)))
-        results = [name for name, in await self.bot.pokeapi.execute_fetchall(statement, args)]
-        if not results:
-            await ctx.send('No results found.')
-        elif len(results) > 20 and not show_all:
-            await ctx.send(f'{", ".join(results[:20])}, and {len(results) - 20} more')
-        else:
-            pag = commands.Paginator('', '', max_size=1500)
-            [pag.add_line(name) for name in results]
-            for i, page in enumerate(pag.pages):
-                await ctx.send(page.strip().replace('\n', ', ') + (', ...' if i < len(pag.pages) - 1 else ''))
+        await self.send_search_results(ctx, query, move_table.sorted_rows(mask), move_table.resolve_names)
 
     @movesearch.error
     async def movesearch_error(self, ctx: MyContext, exc: commands.CommandError):
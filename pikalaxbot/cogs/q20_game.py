@@ -3,19 +3,47 @@ import math
 from discord.ext import commands
 from . import *
 from .utils.game import GameBase, GameCogBase, Game, GameStartCommand
+from .utils.tokenize import tokenize
 from ..types import *
 import re
 import difflib
+import time
 import random
-import nltk
 import asyncio
+import contextvars
+import numpy as np
+import asyncstdlib.functools as afunctools
 from contextlib import asynccontextmanager as acm
-from typing import Optional, Any
+from typing import Optional
 from collections.abc import Callable, Coroutine
-from ..pokeapi import PokeapiModel, methods as pokeapi
+from ..pokeapi import PokeapiModel, SpeciesTable, MoveTable, methods as pokeapi
+from ..pokeapi.tables import NULL
 
 
-ParseMethod = Callable[[str], Coroutine[None, None, tuple[Optional[str], int, bool, float]]]
+# Parsers return the item asked about, the message index, the mask of
+# species for which the answer is yes, and the confidence.
+ParseMethod = Callable[[str], Coroutine[None, None, tuple[Optional[str], int, Optional[np.ndarray], float]]]
+
+# (table, span) -> match for the question being parsed. Parser tasks
+# inherit the dict, so parsers share each other's lookups.
+span_memo: contextvars.ContextVar[Optional[dict[tuple[type[PokeapiModel], str], Optional[PokeapiModel]]]] = \
+    contextvars.ContextVar('span_memo', default=None)
+
+
+@afunctools.lru_cache(maxsize=4096)
+async def find_named(table: type[PokeapiModel], span: str) -> Optional[PokeapiModel]:
+    # Keyed on the class, so a PokeAPI rebuild starts from a cold cache.
+    return await table.find_named(span)
+
+
+def merge_aliases(lut: dict[re.Pattern, int]) -> tuple[re.Pattern, tuple[int, ...]]:
+    """Fold an alias table into a single alternation. Alternatives are
+    tried in order, so the group that matches is the first alias in the
+    table that matches the span."""
+    return re.compile('|'.join(
+        f'(?P<a{i}>(?i:{pat.pattern}))' if pat.flags & re.I else f'(?P<a{i}>{pat.pattern})'
+        for i, pat in enumerate(lut)
+    )), tuple(lut.values())
 
 
 @acm
@@ -155,11 +183,59 @@ class Q20QuestionParser:
         re.compile(r'land\'?s ?wrath', re.I): 616,
     }
 
-    def __init__(self, game):
-        self.game: Q20GameObject = game
-        self.bot: PikalaxBOT = game.bot
+    _mon_aliases = merge_aliases(mon_search)
+    _move_aliases = merge_aliases(move_search)
+
+    # Parsers that can apply to any question, since they hinge on a name lookup
+    ALWAYS_ROUTED = frozenset({'pokemon', 'type_', 'type_challenge', 'color', 'pokedex'})
+
+    # Keyword -> parsers that can only apply when it's in the question.
+    # No word may match more than one of these.
+    ROUTES = {
+        r'learn|know|move|tm': ('move',),
+        r'have|ability': ('ability',),
+        r'evolve|evolutions|mega|branch|stone|trade': ('evolution',),
+        r'family|evolution(ary)?|tree|line': ('family',),
+        r'revived|fossil|legendary|mythical|starter|ultra|baby': ('booleans',),
+        r'meters?|m|h(ei|ie)ght|size|tall(er)?|big(ger)?|(short|small)(er)?|[0-9]+(\.[0-9]+)?(m|meters?)': ('size',),
+        r'kilo(gram)?s?|kg|w(ei|ie)gh[ts]?|mass|heav(y|ier)|light(er)?|[0-9]+(\.[0-9]+)?(kg|kilo(gram)?s?)': ('weight',),
+        r'more|less': ('weight', 'stats'),
+        r'[<>]': ('size', 'weight', 'stats'),
+        r'base|stats?|total|bst|hp|at(tac)?k|sp(ecial|e?c)?\.?(at(tac)?k|def(en[cs]e)?)?|def(en[cs]e)?|sp(eed|e|d)'
+        r'|fast(er)?|(high|great)(er)?|low(er)?': ('stats',),
+        r'live|habitat': ('habitat',),
+        r'shaped?|form(ed)?': ('body',),
+        r'egg|group|breeding': ('egg',),
+        r'mate|breed|fuck': ('mating',),
+    }
+    _router = re.compile(
+        r'(?<!\w)(?:' + '|'.join(f'(?P<r{i}>{pat})' for i, pat in enumerate(ROUTES)) + r')(?!\w)',
+        re.I
+    )
+    _route_targets = tuple(ROUTES.values())
+
+    def __init__(self, bot: PikalaxBOT):
+        self.bot = bot
         self.differ = difflib.SequenceMatcher()
-        self.tokenizer = nltk.WordPunctTokenizer()
+
+    @classmethod
+    def route(cls, question: str) -> set[str]:
+        """Names of the parse methods that can apply to the question,
+        found in a single scan."""
+        routes = set(cls.ALWAYS_ROUTED)
+        for match in cls._router.finditer(question):
+            routes.update(cls._route_targets[int(match.lastgroup[1:])])
+        return routes
+
+    @staticmethod
+    async def lookup_span(table: type[PokeapiModel], span: str) -> Optional[PokeapiModel]:
+        memo = span_memo.get()
+        if memo is None:
+            return await find_named(table, span)
+        key = table, span
+        if key not in memo:
+            memo[key] = await find_named(table, span)
+        return memo[key]
 
     async def lookup_name(self, table: type[PokeapiModel], q: str) -> tuple[Optional[str], Optional[PokeapiModel], float]:
         def iter_matches(callable_: Callable[[str], R]) -> R:
@@ -169,11 +245,10 @@ class Q20QuestionParser:
             for word in q.split():
                 yield callable_(word)
 
-        def get_first_match(lut: dict[re.Pattern, int]) -> tuple[Optional[re.Match], Optional[int]]:
-            return discord.utils.find(
-                lambda t: next((m for m in iter_matches(t[0].match) if m is not None), None) is not None,
-                lut.items()
-            ) or (None, None)
+        def get_first_match(aliases: tuple[re.Pattern, tuple[int, ...]]) -> Optional[int]:
+            pattern, ids = aliases
+            indices = [int(m.lastgroup[1:]) for m in iter_matches(pattern.match) if m is not None]
+            return ids[min(indices)] if indices else None
 
         id_: Optional[int]
         r: Optional[PokeapiModel]
@@ -181,9 +256,9 @@ class Q20QuestionParser:
         orig: Optional[str]
 
         if table in (PokeapiModel.classes.Pokemon, PokeapiModel.classes.PokemonSpecies):
-            _, id_ = get_first_match(Q20QuestionParser.mon_search)
+            id_ = get_first_match(Q20QuestionParser._mon_aliases)
         elif table is PokeapiModel.classes.Move:
-            _, id_ = get_first_match(Q20QuestionParser.move_search)
+            id_ = get_first_match(Q20QuestionParser._move_aliases)
         else:
             id_ = None
         if id_:
@@ -195,10 +270,8 @@ class Q20QuestionParser:
             r = None
             orig = None
             name = None
-            for coro, orig in iter_matches(
-                lambda s: (table.get_named(s), s)
-            ):  # type: Coroutine[Any, Any, Optional[PokeapiModel]], str
-                r = await coro
+            for orig in iter_matches(lambda s: s):
+                r = await self.lookup_span(table, orig)
                 if r:
                     break
             confidence = 0.
@@ -209,15 +282,27 @@ class Q20QuestionParser:
                 confidence = self.differ.ratio()
         return name, r, confidence
 
-    async def parse(self, question: str) -> tuple[str, bool, bool]:
-        solution = self.game._solution
+    async def parse(
+            self,
+            game: 'Q20GameObject',
+            question: str,
+            timings: Optional[dict[str, float]] = None
+    ) -> tuple[str, bool, bool, Optional[np.ndarray]]:
+        """If timings is given, the seconds spent in each parse method
+        are recorded in it."""
+        solution = game._solution
+        table: SpeciesTable = self.bot.pokeapi.species_table
+        move_table: MoveTable = self.bot.pokeapi.move_table
+        sol = table.index(solution.id)
+        tokens = tokenize(question)
 
         async def pokemon(q):
             q = self.IGNORE_WORDS_1.sub('', q)
             q = re.sub(r'\s+', ' ', q, flags=re.I)
             name, found, confidence = await self.lookup_name(PokeapiModel.classes.PokemonSpecies, q)
             won = found and found.id == solution.id
-            return name, 0, won, (name is not None) * (1000 if won else 0.5 * confidence)
+            mask = table.ids == found.id if found else None
+            return name, 0, mask, (name is not None) * (1000 if won else 0.5 * confidence)
 
         async def move(q):
             confidence = len(re.findall(r'\b(learn|know|move|tm)\b', q, re.I)) * 5
@@ -227,7 +312,7 @@ class Q20QuestionParser:
             name, found, confidence_f = await self.lookup_name(PokeapiModel.classes.Move, q)
             return name, \
                 0, \
-                found and await pokeapi.mon_can_learn_move(solution, found), \
+                move_table.learners_of(found.id) if found else None, \
                 confidence * confidence_f
 
         async def ability(q):
@@ -236,7 +321,7 @@ class Q20QuestionParser:
             q = re.sub(r'\b(have|ability)\b', '', q, flags=re.I)
             q = re.sub(r'\s+', ' ', q, flags=re.I)
             name, found, confidence_f = await self.lookup_name(PokeapiModel.classes.Ability, q)
-            return name, 0, found and await pokeapi.mon_has_ability(solution, found), confidence * confidence_f
+            return name, 0, table.has_ability(found.id) if found else None, confidence * confidence_f
 
         async def type_challenge(q):
             # fuck you tustin
@@ -245,7 +330,7 @@ class Q20QuestionParser:
             dualtype = 0
             nwords = len(re.findall(r'\w+', q))
             if re.search(r'\begg\b', q):
-                return None, 0, False, 0
+                return None, 0, None, 0
             q = re.sub(r'\s+', ' ', q, flags=re.I)
             typeeffect -= len(re.findall(r'\b(resist|strong)\b', q, re.I))
             typeeffect += len(re.findall(r'\bweak\b', q, re.I))
@@ -282,7 +367,7 @@ class Q20QuestionParser:
                         name, _move, confidence_f = await self.lookup_name(PokeapiModel.classes.Move, q)
                         if _move:
                             message = 3 + (typeeffect < 0)
-            return name, message, False, confidence * confidence_f
+            return name, message, None, confidence * confidence_f
 
         async def type_(q):
             # fuck you tustin
@@ -291,7 +376,7 @@ class Q20QuestionParser:
             dualtype = 0
             nwords = len(re.findall(r'\w+', q))
             if re.search(r'\begg\b', q):
-                return None, 0, False, 0
+                return None, 0, None, 0
             q = re.sub(r'\s+', ' ', q, flags=re.I)
             typeeffect -= len(re.findall(r'\b(resist|strong)\b', q, re.I))
             typeeffect += len(re.findall(r'\bweak\b', q, re.I))
@@ -316,55 +401,60 @@ class Q20QuestionParser:
             confidence = (nwords - nunkwords) / nwords * 5
             name, found, confidence_f = await self.lookup_name(PokeapiModel.classes.Type, q)
             message = 0
-            result = False
+            mask = None
             flags = 0
+
+            def effective(matchup: np.ndarray) -> np.ndarray:
+                return matchup < 1 if typeeffect < 0 else matchup > 1
+
             if singletype and not found:
-                mon_types = await pokeapi.get_mon_types(solution)
-                result = len(mon_types) == 1
+                mask = table.type_count() == 1
                 name = 'single'
             elif dualtype and not found:
-                mon_types = await pokeapi.get_mon_types(solution)
-                result = len(mon_types) == 2
+                mask = table.type_count() == 2
                 name = 'dual'
             elif typeeffect:
                 if found:
-                    testeffect = await pokeapi.get_mon_matchup_against_type(solution, found)
+                    testeffect = table.matchup_against_type(found.id)
                     message = 1 + (typeeffect < 0)
-                    result = testeffect > 1 and typeeffect > 0 or testeffect < 1 and typeeffect < 0
-                    if testeffect == 0:
+                    mask = effective(testeffect)
+                    if testeffect[sol] == 0:
                         flags |= 0x20000
                 else:
                     name, mon, confidence_f = await self.lookup_name(PokeapiModel.classes.PokemonSpecies, q)
                     if mon:
-                        testeffect = await pokeapi.get_mon_matchup_against_mon(solution, mon)
+                        testeffect = [
+                            table.matchup_against_type(type_id)
+                            for type_id in table.types[table.index(mon.id)].tolist()
+                            if type_id != NULL
+                        ]
                         assert len(testeffect) in (1, 2)
                         message = 3 + (typeeffect < 0)
+                        mask = np.logical_or.reduce([effective(matchup) for matchup in testeffect])
                         if len(testeffect) == 2:
-                            if testeffect[0] < 1 and testeffect[1] > 1 or testeffect[0] > 1 and testeffect[1] < 1:
-                                result = False
+                            mixed = (testeffect[0] < 1) & (testeffect[1] > 1) \
+                                | (testeffect[0] > 1) & (testeffect[1] < 1)
+                            mask &= ~mixed
+                            if mixed[sol]:
                                 flags |= 0x10000
-                            else:
-                                result = testeffect[0] < 1 and typeeffect < 0 \
-                                     or testeffect[0] > 1 and typeeffect > 0 \
-                                     or testeffect[1] < 1 and typeeffect < 0 \
-                                     or testeffect[1] > 1 and typeeffect > 0
-                        else:
-                            result = testeffect[0] < 1 and typeeffect < 0 or testeffect[0] > 1 and typeeffect > 0
-                        if 0 in testeffect:
+                        if any(matchup[sol] == 0 for matchup in testeffect):
                             flags |= 0x20000
                     else:
                         name, _move, confidence_f = await self.lookup_name(PokeapiModel.classes.Move, q)
                         if _move:
-                            testeffect = await pokeapi.get_mon_matchup_against_move(solution, _move)
+                            type_ids = [_move.type_id]
+                            if _move.id == 560:
+                                type_ids.append(3)
+                            testeffect = np.prod([table.matchup_against_type(type_id) for type_id in type_ids], axis=0)
                             message = 3 + (typeeffect < 0)
-                            result = testeffect < 1 and typeeffect < 0 or testeffect > 1 and typeeffect > 0
-                            if testeffect == 0:
+                            mask = effective(testeffect)
+                            if testeffect[sol] == 0:
                                 flags |= 0x20000
                             if (await _move.move_damage_class).name == 'status':
                                 flags |= 0x40000
             elif found:
-                result = await pokeapi.mon_has_type(solution, found)
-            return name, message, result, confidence * confidence_f + flags
+                mask = table.has_type(found.id)
+            return name, message, mask, confidence * confidence_f + flags
 
         async def color(q):
             q = self.IGNORE_WORDS_1.sub('', q)
@@ -372,7 +462,7 @@ class Q20QuestionParser:
             name, _color, confidence = await self.lookup_name(PokeapiModel.classes.PokemonColor, q)
             return name, \
                 0, \
-                _color and _color == await solution.pokemon_color, \
+                table.color_id == _color.id if _color else None, \
                 confidence / len(re.findall(r'\w+', q)) if q else 0
 
         async def evolution(q):
@@ -389,34 +479,33 @@ class Q20QuestionParser:
             confidence = (nwords - nunkwords) / nwords
             item = None
             message = 0
-            result = False
+            mask = None
             if mega:
                 item = 'found'
                 message = 2
-                result = await pokeapi.has_mega_evolution(solution)
+                mask = table.has_mega
             elif has:
                 item = 'found'
                 message = 3
-                result = bool(await solution.evolves_from_species or await pokeapi.has_evos(solution))
+                mask = (table.evolves_from != NULL) | (table.chain_size > 1)
             elif branch:
                 message = 5
-                result = await pokeapi.has_branching_evos(solution)
+                mask = table.chain_branches
                 item = 'found'
             elif stone or trade:
                 message = 4
-                methods_ = await pokeapi.get_mon_evolution_methods(solution)
-                result = discord.utils.get(methods_, evolution_trigger_id=2 + stone) is not None
+                mask = table.evolves_by(2 + stone)
                 item = 'stone' if stone else 'trade'
-            return item, message, result, confidence
+            return item, message, mask, confidence
 
         async def family(q):
             if not re.search(r'\b(family|evolution(ary)?|tree|line)\b', q, re.I):
-                return None, 0, False, 0
+                return None, 0, None, 0
             q = self.IGNORE_WORDS_1.sub('', q)
             q = re.sub(r'\b(family|evolution(ary)?|tree|line|part|of)\b', '', q, flags=re.I)
             q = re.sub(r'\s+', ' ', q)
             name, res, confidence = await self.lookup_name(PokeapiModel.classes.PokemonSpecies, q)
-            return name, 0, res and await pokeapi.is_in_evo_line(solution, res), confidence
+            return name, 0, table.in_family(table.index(res.id)) if res else None, confidence
 
         async def pokedex(q):
             is_mine = re.search(r'\b(generation|gen|poke(dex)?|dex|region)\b', q, re.I) is not None
@@ -441,25 +530,23 @@ class Q20QuestionParser:
             q = re.sub(r'\s+', '', q)
             dex_name, dex, confidence = await self.lookup_name(PokeapiModel.classes.Pokedex, q)
             if dex_name is None and not is_mine:
-                return None, 0, False, 0
+                return None, 0, None, 0
             if dex_name is not None:
-                result = await pokeapi.mon_is_in_dex(solution, dex)
+                mask = table.in_pokedex(dex.id)
                 message = 1
                 item = dex_name
             elif generation > -1:
-                solution_gen = await solution.generation
-                result = solution_gen.id == generation
+                mask = table.generation_id == generation
                 message = 0
                 item = f'Generation {generation}'
             else:
                 region_name, region, confidence = await self.lookup_name(PokeapiModel.classes.Region, q)
                 if region_name is None:
-                    return None, 0, False, 0
-                solution_gen = await solution.generation
-                result = solution_gen.id == region.id
+                    return None, 0, None, 0
+                mask = table.generation_id == region.id
                 message = 0
                 item = f'{region_name} region'
-            return item, message, result, 10 * confidence
+            return item, message, mask, 10 * confidence
 
         async def booleans(q):
             fossil = re.search(r'\b(revived|fossil)\b', q, re.I) is not None
@@ -469,18 +556,18 @@ class Q20QuestionParser:
             ultra = re.search(r'\bultra( br?easts?)?\b', q, re.I) is not None
             baby = re.search(r'\bbaby\b', q, re.I) is not None
             if mythical:
-                return 'Mythical', 0, solution.is_mythical, 10
+                return 'Mythical', 0, table.is_mythical, 10
             if legendary:
-                return 'Legendary', 0, solution.is_legendary, 10
+                return 'Legendary', 0, table.is_legendary, 10
             if fossil:
-                return 'Fossil', 0, solution.id in self.FOSSILS, 10
+                return 'Fossil', 0, np.isin(table.ids, self.FOSSILS), 10
             if starter:
-                return 'Starter', 0, solution.id in self.STARTERS, 10
+                return 'Starter', 0, np.isin(table.ids, self.STARTERS), 10
             if ultra:
-                return 'Ultra Beast', 0, solution.id in self.ULTRA_BEASTS, 10
+                return 'Ultra Beast', 0, np.isin(table.ids, self.ULTRA_BEASTS), 10
             if baby:
-                return 'Baby Pokémon', 0, solution.is_baby, 10
-            return None, 0, False, 0
+                return 'Baby Pokémon', 0, table.is_baby, 10
+            return None, 0, None, 0
 
         async def size(q):
             size_compare = 0
@@ -491,7 +578,7 @@ class Q20QuestionParser:
             name = 'meters'
             equal_message = 2
             confidence = 1
-            for word in nltk.TreebankWordTokenizer().tokenize(q):
+            for word in tokens:
                 if not word or self.IGNORE_WORDS_1.match(word):
                     pass
                 elif re.match(r'^as$', word, re.I):
@@ -518,9 +605,8 @@ class Q20QuestionParser:
                 else:
                     unknown_tokens.append(word)
             if not is_this_question:
-                return None, 0, False, 0
-            solution_forme = await pokeapi.get_default_pokemon(solution)
-            height = solution_forme.height
+                return None, 0, None, 0
+            height = table.column('height')
             if size_literal <= 0:
                 equal_message = 3
                 conglom = ' '.join(unknown_tokens)
@@ -539,29 +625,28 @@ class Q20QuestionParser:
                 else:
                     name, mon, confidence_f = await self.lookup_name(PokeapiModel.classes.PokemonSpecies, conglom)
                     if mon:
-                        forme = await pokeapi.get_default_pokemon(mon)
-                        size_literal = forme.height / 10
+                        size_literal = height.values[table.index(mon.id)] / 10
                         confidence = confidence_f
             if size_literal > 0:
                 if wrong_scale_error:
-                    return 'error', 4, False, 1
+                    return 'error', 4, None, 1
                 compare_size_literal = round(size_literal * 10)
                 if size_compare < 0:
                     message = 0
-                    result = height < compare_size_literal
+                    mask = height.compare('<', compare_size_literal)
                 elif size_compare > 0:
                     message = 1
-                    result = height > compare_size_literal
+                    mask = height.compare('>', compare_size_literal)
                 else:
                     message = equal_message
-                    result = height == compare_size_literal
+                    mask = height.compare('=', compare_size_literal)
                 if name == 'meters':
                     item = f'{size_literal}m'
                 else:
                     item = f'{name} ({size_literal}m)'
-                return item, message, result, 10 * confidence
+                return item, message, mask, 10 * confidence
 
-            return None, 0, False, 0
+            return None, 0, None, 0
 
         async def weight(q):
             size_compare = 0
@@ -572,7 +657,7 @@ class Q20QuestionParser:
             name = 'kilograms'
             equal_message = 2
             confidence = 1
-            for word in nltk.TreebankWordTokenizer().tokenize(q):
+            for word in tokens:
                 if not word or self.IGNORE_WORDS_1.match(word):
                     pass
                 elif re.match(r'^as$', word, re.I):
@@ -599,9 +684,8 @@ class Q20QuestionParser:
                 else:
                     unknown_tokens.append(word)
             if not is_this_question:
-                return None, 0, False, 0
-            solution_forme = await pokeapi.get_default_pokemon(solution)
-            _weight = solution_forme.weight
+                return None, 0, None, 0
+            _weight = table.column('weight')
             if size_literal <= 0:
                 equal_message = 3
                 conglom = ' '.join(unknown_tokens)
@@ -617,38 +701,37 @@ class Q20QuestionParser:
                 else:
                     name, mon, confidence_f = await self.lookup_name(PokeapiModel.classes.PokemonSpecies, conglom)
                     if mon:
-                        forme = await pokeapi.get_default_pokemon(mon)
-                        size_literal = forme.weight / 10
+                        size_literal = _weight.values[table.index(mon.id)] / 10
                         confidence = confidence_f
             if size_literal > 0:
                 if wrong_scale_error:
-                    return 'error', 4, False, 1
+                    return 'error', 4, None, 1
                 compare_size_literal = round(size_literal * 10)
                 if size_compare < 0:
                     message = 0
-                    result = _weight < compare_size_literal
+                    mask = _weight.compare('<', compare_size_literal)
                 elif size_compare > 0:
                     message = 1
-                    result = _weight > compare_size_literal
+                    mask = _weight.compare('>', compare_size_literal)
                 else:
                     message = equal_message
-                    result = _weight == compare_size_literal
+                    mask = _weight.compare('=', compare_size_literal)
                 if name == 'kilograms':
                     item = f'{size_literal}kg'
                 else:
                     item = f'{name} ({size_literal}kg)'
-                return item, message, result, 10 * confidence
+                return item, message, mask, 10 * confidence
 
-            return None, 0, False, 0
+            return None, 0, None, 0
 
         async def habitat(q):
             if not re.search(r'\b(live|habitat)\b', q, re.I):
-                return None, 0, False, 0
+                return None, 0, None, 0
             q = self.IGNORE_WORDS_1.sub('', q)
             q = re.sub(r'\b(live|habitat|does|along|in|around)\b', '', q, flags=re.I)
             q = re.sub(r'\s+', '', q)
             name, _habitat, confidence = await self.lookup_name(PokeapiModel.classes.PokemonHabitat, q)
-            return name, 0, _habitat == await solution.habitat, confidence
+            return name, 0, table.habitat_id == (_habitat.id if _habitat else NULL), confidence
 
         async def stats(q):
             stat_name = None
@@ -660,7 +743,7 @@ class Q20QuestionParser:
             confidence = 1
             equal_message = 3
             name = None
-            for word in nltk.TreebankWordTokenizer().tokenize(q):
+            for word in tokens:
                 if not word or self.IGNORE_WORDS_1.match(word):
                     pass
                 elif re.match(r'^as$', word, re.I):
@@ -709,46 +792,40 @@ class Q20QuestionParser:
                 else:
                     unknown_tokens.append(word)
             if not is_this_question or not stat_name:
-                return None, 0, False, 0
+                return None, 0, None, 0
 
             if special:
                 stat_name = f'Special {stat_name}'
 
-            async def get_stat_value(mon_: PokeapiModel.classes.PokemonSpecies):
-                base_stats = await pokeapi.get_base_stats(mon_)
-                if stat_name == 'Stat Total':
-                    return sum(base_stats.values())
-                return base_stats.get(stat_name, 0)
-
-            compare_value = await get_stat_value(solution)
+            compare_value = table.column(stat_name)
             if stat_literal <= 0:
                 equal_message = 3
                 conglom = ' '.join(unknown_tokens)
                 name, mon, confidence_f = await self.lookup_name(PokeapiModel.classes.PokemonSpecies, conglom)
                 if mon:
-                    stat_literal = await get_stat_value(mon)
+                    stat_literal = int(compare_value.values[table.index(mon.id)])
                     confidence = confidence_f
             if stat_literal > 0:
                 if stat_compare < 0:
                     message = 0
-                    result = compare_value < stat_literal
+                    mask = compare_value.compare('<', stat_literal)
                 elif stat_compare > 0:
                     message = 1
-                    result = compare_value > stat_literal
+                    mask = compare_value.compare('>', stat_literal)
                 else:
                     message = equal_message
-                    result = compare_value == stat_literal
+                    mask = compare_value.compare('=', stat_literal)
                 if name is None:
                     item = f'{stat_literal}'
                 else:
                     item = f'{name} ({stat_literal})'
-                return (stat_name, item), message, result, 10 * confidence
+                return (stat_name, item), message, mask, 10 * confidence
 
-            return None, 0, False, 0
+            return None, 0, None, 0
 
         async def body(q):
             if not re.search(r'\b(shaped?|form(ed)?)\b', q, re.I):
-                return None, 0, False, 0
+                return None, 0, None, 0
             q = self.IGNORE_WORDS_1.sub('', q)
             q = re.sub(r'\b(shaped?|form(ed)?|like)', '', q, flags=re.I)
             name, shape, confidence = await self.lookup_name(PokeapiModel.classes.PokemonShape, q)
@@ -756,34 +833,38 @@ class Q20QuestionParser:
             if not name:
                 name, mon, confidence = await self.lookup_name(PokeapiModel.classes.PokemonSpecies, q)
                 if not name:
-                    return None, 0, False, 0
+                    return None, 0, None, 0
                 message = 1
-                shape = await mon.pokemon_shape
-            return name, message, shape == await solution.pokemon_shape, confidence
+                shape_id = table.shape_id[table.index(mon.id)]
+            else:
+                shape_id = shape.id if shape else NULL
+            return name, message, table.shape_id == shape_id, confidence
 
         async def egg(q):
             if not re.search(r'\b(egg|group|breeding)\b', q, re.I):
-                return None, 0, False, 0
+                return None, 0, None, 0
             q = self.IGNORE_WORDS_1.sub('', q)
             q = re.sub(r'\b(part|of|egg|group|breeding)\b', '', q, flags=re.I)
             q = re.sub(r'\s+', ' ', q, flags=re.I)
             name, res, confidence = await self.lookup_name(PokeapiModel.classes.EggGroup, q)
-            return name, 0, res and await pokeapi.mon_is_in_egg_group(solution, res), confidence
+            return name, 0, table.in_egg_group(res.id) if res else None, confidence
 
         async def mating(q):
             # owo
             if not re.search(r'\b(mate|breed|fuck)\b', q, re.I):
-                return None, 0, False, 0
+                return None, 0, None, 0
             q = self.IGNORE_WORDS_1.sub('', q)
             q = re.sub(r'\b(mate|breed|with|fuck)\b', '', q, flags=re.I)
             q = re.sub(r'\s+', ' ', q, flags=re.I)
             name, res, confidence = await self.lookup_name(PokeapiModel.classes.PokemonSpecies, q)
             if not res:
-                return None, 0, False, 0
+                return None, 0, None, 0
             flags = 0
-            breedable = await pokeapi.mon_can_mate_with(solution, res)
-            res_is_undiscovered = await pokeapi.mon_is_in_undiscovered_egg_group(res)
-            solution_is_undiscovered = await pokeapi.mon_is_in_undiscovered_egg_group(solution)
+            res_row = table.index(res.id)
+            breedable = table.can_mate_with(res_row)
+            undiscovered = table.undiscovered()
+            res_is_undiscovered = undiscovered[res_row]
+            solution_is_undiscovered = undiscovered[sol]
             if 132 in {solution.id, res.id}:
                 flags |= 0x10000
             if solution_is_undiscovered or res_is_undiscovered:
@@ -800,7 +881,7 @@ class Q20QuestionParser:
             pokemon: ['Is it {}?'],
             move: ['Can it learn {}?'],
             ability: ['Can it have the ability {}?'],
-            (type_challenge if self.game.challenge_mode else type_): [
+            (type_challenge if game.challenge_mode else type_): [
                 'Is it {} type?',
                 'Is it weak to {} type?',
                 'Does it resist {} type?',
@@ -844,8 +925,15 @@ class Q20QuestionParser:
             mating: ['Can it mate with {}?']
         }
 
-        async def work(method: ParseMethod, msgbank: list[str]) -> Optional[tuple[float, str, bool, bool]]:
-            _item, _message, match, _confidence = await method(question)
+        async def work(
+                method: ParseMethod,
+                msgbank: list[str]
+        ) -> Optional[tuple[float, str, bool, bool, Optional[np.ndarray]]]:
+            start = time.perf_counter()
+            _item, _message, mask, _confidence = await method(question)
+            if timings is not None:
+                timings[method.__name__] = time.perf_counter() - start
+            match = mask is not None and bool(mask[sol])
             _flags, _confidence = divmod(_confidence, 0x10000)
             _flags = int(_flags)
             self.bot.log_debug(
@@ -880,7 +968,7 @@ class Q20QuestionParser:
                 elif method in {size, weight} and _message == 4:
                     valid = False
                 elif method == evolution and _message == 3 and match:
-                    match_t = 'Yes, it has evolved' if await solution.evolves_from_species else 'Yes, it will evolve'
+                    match_t = 'Yes, it has evolved' if table.evolves_from[sol] != NULL else 'Yes, it will evolve'
                 elif method in {move, egg} and solution.id > 807:
                     match_t = 'I have no clue'
                     defered_valid = False
@@ -905,19 +993,22 @@ class Q20QuestionParser:
                     valid = defered_valid
                 else:
                     response_s = msgbank[_message].format(*_item)
-                return _confidence, response_s, method == pokemon and match, valid
+                return _confidence, response_s, method == pokemon and match, valid, mask
 
-        tasks = [asyncio.create_task(work(*x)) for x in methods.items()]
+        routes = self.route(question)
+        token = span_memo.set({})
+        tasks = [asyncio.create_task(work(*x)) for x in methods.items() if x[0].__name__ in routes]
         try:
             done, pending = await asyncio.wait(tasks, timeout=60.0, return_when=asyncio.ALL_COMPLETED)
         except asyncio.TimeoutError:
-            return 'Hmm... I actually have no idea. Try again later, perhaps?', False, False
+            return 'Hmm... I actually have no idea. Try again later, perhaps?', False, False, None
         finally:
             [task.cancel() for task in tasks]
+            span_memo.reset(token)
         responses = list(filter(None, (x.result() for x in done)))
         if not responses:
-            return 'Huh? I didn\'t understand that', False, False
-        return max(responses)[1:]
+            return 'Huh? I didn\'t understand that', False, False, None
+        return max(responses, key=lambda response: response[:4])[1:]
 
 
 class Q20GameObject(GameBase):
@@ -954,19 +1045,22 @@ class Q20GameObject(GameBase):
         "is it faster than lord helix",
     )
 
-    def __init__(self, bot):
+    def __init__(self, bot, parser: Optional[Q20QuestionParser] = None):
         super().__init__(bot, timeout=None)
         self._state: list[str] = []
         self._attempts = 20
-        self._parser = Q20QuestionParser(self)
+        self._parser = parser or Q20QuestionParser(bot)
         self.attempts = 0
         self.challenge_mode = False
         self._plando_maker: Optional[discord.Member] = None
         self._solution: Optional[PokeapiModel.classes.PokemonSpecies] = None
+        # Species consistent with every answer given so far
+        self._candidates: Optional[np.ndarray] = None
 
     def reset(self):
         super().reset()
         self._solution = None
+        self._candidates = None
         self._state = []
         self.attempts = 0
         self.challenge_mode = False
@@ -994,6 +1088,7 @@ class Q20GameObject(GameBase):
             await ctx.send(f'{ctx.author.mention}: Q20 is already running here.', delete_after=10)
         else:
             self._solution = plando or await pokeapi.random_pokemon()
+            self._candidates = self.bot.pokeapi.species_table.all()
             self.attempts = self._attempts
             self.challenge_mode = challenge_mode
             if plando:
@@ -1042,6 +1137,50 @@ class Q20GameObject(GameBase):
                            f'Start a game by saying `{ctx.prefix}start`.',
                            delete_after=10)
 
+    def _current_candidates(self) -> np.ndarray:
+        """The candidate mask, reset if it no longer fits the species table."""
+        table: SpeciesTable = self.bot.pokeapi.species_table
+        if self._candidates is None or len(self._candidates) != len(table):
+            # PokeAPI was rebuilt under us
+            self._candidates = table.all()
+        return self._candidates
+
+    def narrow(self, mask: np.ndarray):
+        table: SpeciesTable = self.bot.pokeapi.species_table
+        candidates = self._current_candidates()
+        candidates &= mask if mask[table.index(self._solution.id)] else ~mask
+
+    async def get_hint(self) -> Optional[str]:
+        """The question that comes closest to splitting the remaining
+        candidates in half."""
+        table: SpeciesTable = self.bot.pokeapi.species_table
+        candidates = self._current_candidates()
+        remaining = int(candidates.sum())
+        options: list[tuple[np.ndarray, type[PokeapiModel], Optional[int], str]] = [
+            (table.has_type(type_id), PokeapiModel.classes.Type, type_id, 'Is it {} type?')
+            for type_id in table.type_ids.tolist()
+        ]
+        for column, model, template in (
+            (table.color_id, PokeapiModel.classes.PokemonColor, 'Is its colour {}?'),
+            (table.shape_id, PokeapiModel.classes.PokemonShape, 'Is it {}-shaped?'),
+            (table.habitat_id, PokeapiModel.classes.PokemonHabitat, 'Does it live in the {} habitat?'),
+            (table.generation_id, None, 'Is it a Generation {} Pokemon?'),
+        ):
+            options += [
+                (column == value, model, value, template)
+                for value in np.unique(column[candidates]).tolist()
+                if value != NULL
+            ]
+        options.sort(key=lambda option: abs(2 * int((option[0] & candidates).sum()) - remaining))
+        for mask, model, value, template in options:
+            if not 0 < int((mask & candidates).sum()) < remaining:
+                break
+            if model is not None:
+                if (entity := await model.get(value)) is None:
+                    continue
+                value = entity.qualified_name
+            return template.format(value)
+
     async def ask(self, ctx: MyContext, question: str):
         if not self.running:
             if ctx.command:
@@ -1051,7 +1190,7 @@ class Q20GameObject(GameBase):
             return await ctx.send('It\'s not fair for you to play!')
         try:
             async with ctx.typing(), thinking(ctx):
-                message, res, valid = await self._parser.parse(question)
+                message, res, valid, mask = await self._parser.parse(self, question)
         except Exception as e:
             await ctx.message.add_reaction('\N{CROSS MARK}')
             await ctx.send('Something fucked up, imma tell pika daddy')
@@ -1064,6 +1203,8 @@ class Q20GameObject(GameBase):
         if not valid:
             return
         self._state.append(message)
+        if mask is not None:
+            self.narrow(mask)
         self.attempts -= 1
         self.add_player(ctx.author)
         if res:
@@ -1076,6 +1217,14 @@ class Q20GameObject(GameBase):
 class Q20Game(GameCogBase[Q20GameObject]):
     """Commands related to playing Pokemon Q20."""
 
+    def __init__(self, bot):
+        # One parser serves every channel
+        self.parser = Q20QuestionParser(bot)
+        super().__init__(bot)
+
+    def new_game(self) -> Q20GameObject:
+        return Q20GameObject(self.bot, self.parser)
+
     def cog_check(self, ctx: MyContext):
         return self._local_check(ctx)
 
@@ -1138,11 +1287,24 @@ class Q20Game(GameCogBase[Q20GameObject]):
     @q20.command(name='debug')
     @commands.is_owner()
     @commands.check(lambda ctx: ctx.cog[ctx.channel.id].running)
-    async def q20_debug(self, ctx: MyContext, mon: PokeapiModel.classes.PokemonSpecies):
-        """Set the solution of the running game to the specified mon."""
-
-        self[ctx.channel.id]._solution = mon
-        await ctx.message.add_reaction('\N{WHITE HEAVY CHECK MARK}')
+    async def q20_debug(self, ctx: MyContext, mon: Optional[PokeapiModel.classes.PokemonSpecies] = None):
+        """Show the remaining candidates of the running game.
+        If a mon is given, set it as the solution first."""
+
+        game = self[ctx.channel.id]
+        if mon is not None:
+            game._solution = mon
+            await ctx.message.add_reaction('\N{WHITE HEAVY CHECK MARK}')
+        table: SpeciesTable = self.bot.pokeapi.species_table
+        candidates = np.flatnonzero(game._current_candidates())
+        names = await table.resolve_names(table.ids[candidates[:25]].tolist())
+        hint = await game.get_hint()
+        await ctx.author.send(
+            f'Solution: {game._solution}\n'
+            f'Remaining candidates: {len(candidates)}/{len(table)}\n'
+            f'{", ".join(names)}{", ..." if len(candidates) > 25 else ""}\n'
+            f'Best split: {hint or "none"}'
+        )
 
     @q20.command(name='plando')
     @commands.guild_only()
@@ -1173,7 +1335,7 @@ class Q20Game(GameCogBase[Q20GameObject]):
                     check=lambda m: m.author == ctx.author and m.guild is None,
                     timeout=60.0
                 )
-                _, solution, _ = await self[ctx.channel.id]._parser.lookup_name(
+                _, solution, _ = await self.parser.lookup_name(
                     PokeapiModel.classes.PokemonSpecies,
                     msg.content
                 )
@@ -1189,7 +1351,9 @@ class Q20Game(GameCogBase[Q20GameObject]):
     async def on_message(self, message: discord.Message):
         if message.author == self.bot.user:
             return
-        if not self[message.channel.id].running:
+        # Through GameChannels.get, so the game counts as used
+        game = self.channels.get(message.channel.id)
+        if game is None or not game.running:
             return
         ctx = await self.bot.get_context(message)
         if not ctx.prefix or ctx.valid:
@@ -20,9 +20,9 @@ from collections import defaultdict
 from discord.ext import commands
 import typing
 from . import *
+from ..utils.history import HistoryPriority
 from humanize import naturaldelta
 import re
-import operator
 
 
 class SeenUser(BaseCog):
@@ -48,9 +48,10 @@ class SeenUser(BaseCog):
             if (history := self.history_cache.get(channel)) is None:
                 if not channel.permissions_for(member.guild.me).read_message_history:
                     continue
-                self.history_cache[channel] = history = sorted(
-                    await channel.history(limit=None, after=last).flatten(),
-                    key=operator.attrgetter('id')
+                self.history_cache[channel] = history = await self.bot.history_scheduler.fetch(
+                    channel,
+                    after=last,
+                    priority=HistoryPriority.INTERACTIVE
                 )
             seen_msg = discord.utils.get(reversed(history), author=member) or seen_msg
             last = getattr(seen_msg, 'created_at', last)
@@ -0,0 +1,81 @@
+# PikalaxBOT - A Discord bot in discord.py
+# Copyright (C) 2018-2021  PikalaxALT
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import hashlib
+from collections.abc import Iterable
+
+
+__all__ = ('CountingBloomFilter',)
+
+
+class CountingBloomFilter:
+    """Approximate multiset of strings with one byte counter per slot.
+
+    Membership tests never miss a string that was added and not removed,
+    and wrongly report one that wasn't with probability about fp_rate
+    while no more than capacity strings are in it. Counters stick at 255,
+    after which removals no longer clear them."""
+
+    MAX_COUNT = 255
+
+    def __init__(self, capacity: int, fp_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.fp_rate = fp_rate
+        self._size = max(8, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self._n_hashes = max(1, round(self._size / self.capacity * math.log(2)))
+        self._counts = bytearray(self._size)
+        self._len = 0
+
+    @classmethod
+    def from_iterable(cls, items: Iterable[str], capacity: int, fp_rate=0.001):
+        self = cls(capacity, fp_rate)
+        for item in items:
+            self.add(item)
+        return self
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def nbytes(self):
+        return self._size
+
+    def _slots(self, item: str) -> Iterable[int]:
+        # Double hashing off one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return {(h1 + i * h2) % self._size for i in range(self._n_hashes)}
+
+    def add(self, item: str):
+        for i in self._slots(item):
+            if self._counts[i] < self.MAX_COUNT:
+                self._counts[i] += 1
+        self._len += 1
+
+    def discard(self, item: str):
+        """Remove one copy of item. Only call this for an item that was
+        added, or counters shared with other items go wrong."""
+        slots = self._slots(item)
+        if all(self._counts[i] for i in slots):
+            for i in slots:
+                if self._counts[i] < self.MAX_COUNT:
+                    self._counts[i] -= 1
+            self._len -= 1
+
+    def __contains__(self, item: str):
+        return all(self._counts[i] for i in self._slots(item))
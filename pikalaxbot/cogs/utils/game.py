@@ -21,8 +21,7 @@ import time
 from discord.ext import commands
 from .errors import BadGameArgument
 import typing
-import collections
-from collections.abc import Callable, Coroutine, Mapping
+from collections.abc import Callable, Coroutine
 from .. import *
 from ...types import T
 from ...pokeapi import PokeapiModel, methods
@@ -34,6 +33,7 @@ from sqlalchemy.dialects.postgresql import insert
 __all__ = (
     'find_emoji',
     'GameBase',
+    'GameChannels',
     'GameStartCommand',
     'GameCogBase',
     'Game'
@@ -219,6 +219,50 @@ class GameBase:
             ).set_image(url=sprite_url or discord.Embed.Empty)
 
 
+class GameChannels(dict, typing.Generic[T]):
+    """Game objects by channel id. Looking up a channel without a game
+    creates one. Games that are neither running nor locked are dropped
+    once they've gone idle_timeout seconds without being looked up."""
+
+    def __init__(self, factory: Callable[[], T], idle_timeout=3600.0):
+        super().__init__()
+        self._factory = factory
+        self._idle_timeout = idle_timeout
+        self._last_used: dict[int, float] = {}
+        self._next_sweep = time.monotonic() + idle_timeout
+
+    def __missing__(self, channel: int) -> T:
+        game = self[channel] = self._factory()
+        return game
+
+    def __getitem__(self, channel: int) -> T:
+        now = time.monotonic()
+        # Before the sweep, so the game being looked up isn't dropped
+        self._last_used[channel] = now
+        if now >= self._next_sweep:
+            self.evict_idle(now)
+        return super().__getitem__(channel)
+
+    def get(self, channel: int, default: T = None) -> typing.Optional[T]:
+        """Counts as a use, like subscripting, but never creates a game."""
+        if channel not in self:
+            return default
+        return self[channel]
+
+    def __delitem__(self, channel: int):
+        super().__delitem__(channel)
+        self._last_used.pop(channel, None)
+
+    def evict_idle(self, now: float = None):
+        if now is None:
+            now = time.monotonic()
+        self._next_sweep = now + self._idle_timeout
+        cutoff = now - self._idle_timeout
+        for channel, game in list(self.items()):
+            if self._last_used.get(channel, 0) < cutoff and not game.running and not game._lock.locked():
+                del self[channel]
+
+
 class GameStartCommand(commands.Command):
     @property
     def _max_concurrency(self):
@@ -246,9 +290,12 @@ class GameCogBase(BaseCog, typing.Generic[T]):
 
     def __init__(self, bot):
         super().__init__(bot)
-        self.channels: Mapping[int, T] = collections.defaultdict(lambda: self._gamecls(self.bot))
+        self.channels: GameChannels[T] = GameChannels(self.new_game)
         self._max_concurrency = commands.MaxConcurrency(1, per=commands.BucketType.channel, wait=False)
 
+    def new_game(self) -> T:
+        return self._gamecls(self.bot)
+
     def __getitem__(self, channel: int):
         return self.channels[channel]
 
@@ -16,17 +16,277 @@
 #
 # Unapologetically aped from https://github.com/TwitchPlaysPokemon/tpp/utils/markov.py
 
-from collections import defaultdict, Counter
-from collections.abc import Iterable
-from random import choices
+from collections import defaultdict, deque, Counter
+from collections.abc import Iterable, Iterator, Callable
+from random import choices, randrange
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from array import array
+import sys
+import itertools
+import threading
+import asyncio
+import queue
+import concurrent.futures
 import typing
-import nltk
+
+
+__all__ = ('ngrams', 'Chain', 'CounterChain', 'ChainWorker')
+
+R = typing.TypeVar('R')
 
 
 term = typing.Optional[str]
 
 
+def ngrams(sequence: Iterable, n: int, pad_left=False, pad_right=False, pad_symbol=None) -> Iterator[tuple]:
+    # Same output as nltk.ngrams
+    padding = (pad_symbol,) * (n - 1)
+    it = iter(sequence)
+    if pad_left:
+        it = itertools.chain(padding, it)
+    if pad_right:
+        it = itertools.chain(it, padding)
+    window = deque(itertools.islice(it, n - 1), maxlen=n)
+    for item in it:
+        window.append(item)
+        yield tuple(window)
+
+
 class Chain:
+    """Markov chain over interned tokens that learns every order from 1
+    up to state_size, and generates from the longest state it has seen.
+
+    Token ids are 32 bits, with 0 standing for the None boundary. The
+    states of all orders form one trie keyed from the newest token back:
+    a state is packed into one int with its newest token in the low 32
+    bits, each older token 32 bits above the last, and a 1 bit above the
+    oldest to mark its order. Its successors are entries of
+    token_id << 32 | count: a bare int when there is only one, otherwise
+    an array sorted by token id. Interned tokens are kept even after
+    every message using them is unlearned.
+
+    Interning isn't thread safe. A chain shared between threads should
+    only intern (learn_list, learn_str, intern_list) on one of them; the
+    others can learn and unlearn token ids and generate."""
+
+    # tbl = { 1 << 32 * len(state) | packed_state: next_id << 32 | count, ... }
+    #     | { 1 << 32 * len(state) | packed_state: array('Q', [next_id << 32 | count, ...]), ... }
+    COUNT_MASK = 0xFFFFFFFF
+
+    def __init__(self, state_size=2, store_lowercase=False):
+        self.tbl: dict[int, typing.Union[int, array]] = {}
+        self.state_size = state_size
+        self.store_lowercase = store_lowercase
+        self._tokens: list[term] = [None]
+        self._token_ids: dict[term, int] = {None: 0}
+        # Running totals of the counts in tbl[key], for states with more
+        # than one successor that generate has visited since they last changed
+        self._cumulative: dict[int, array] = {}
+
+    def __bool__(self):
+        return bool(self.tbl)
+
+    def __getstate__(self):
+        # The token id lookup and the sampling cache are rebuilt on load
+        state = self.__dict__.copy()
+        del state['_token_ids'], state['_cumulative']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._token_ids = {obj: token_id for token_id, obj in enumerate(self._tokens)}
+        self._cumulative = {}
+
+    def _intern(self, obj: term) -> int:
+        try:
+            return self._token_ids[obj]
+        except KeyError:
+            token_id = self._token_ids[obj] = len(self._tokens)
+            self._tokens.append(obj)
+            return token_id
+
+    @staticmethod
+    def _pack(token_ids: Iterable[int]) -> int:
+        key = 1
+        for token_id in token_ids:
+            key = key << 32 | token_id
+        return key
+
+    @staticmethod
+    def _suffix_keys(token_ids: typing.Sequence[int]) -> Iterator[int]:
+        """Keys of the states made of the last 1, 2, ... of token_ids,
+        i.e. the path down the trie."""
+        key = 1
+        for shift, token_id in enumerate(reversed(token_ids)):
+            # Swap the order marker for the next older token and a new marker above it
+            key += ((1 << 32 | token_id) - 1) << 32 * shift
+            yield key
+
+    def _learn_ids(self, key: int, token_id: int):
+        self._cumulative.pop(key, None)
+        successors = self.tbl.get(key)
+        entry = token_id << 32 | 1
+        if successors is None:
+            self.tbl[key] = entry
+        elif isinstance(successors, int):
+            if successors >> 32 == token_id:
+                self.tbl[key] = successors + 1
+            else:
+                self.tbl[key] = array('Q', sorted((successors, entry)))
+        else:
+            i = bisect_left(successors, token_id << 32)
+            if i < len(successors) and successors[i] >> 32 == token_id:
+                successors[i] += 1
+            else:
+                successors.insert(i, entry)
+
+    def _unlearn_ids(self, key: int, token_id: int):
+        self._cumulative.pop(key, None)
+        successors = self.tbl.get(key)
+        if successors is None:
+            return
+        if isinstance(successors, int):
+            if successors >> 32 == token_id:
+                if successors & self.COUNT_MASK == 1:
+                    del self.tbl[key]
+                else:
+                    self.tbl[key] = successors - 1
+            return
+        i = bisect_left(successors, token_id << 32)
+        if i < len(successors) and successors[i] >> 32 == token_id:
+            if successors[i] & self.COUNT_MASK == 1:
+                del successors[i]
+                if len(successors) == 1:
+                    self.tbl[key] = successors[0]
+            else:
+                successors[i] -= 1
+
+    def learn(self, state: tuple[term, ...], obj: term):
+        self._learn_ids(self._pack(map(self._intern, state)), self._intern(obj))
+
+    def _windows(self, token_ids: Iterable[int]) -> Iterator[tuple[int, ...]]:
+        # Every token and the closing boundary, after state_size tokens of context
+        return ngrams(itertools.chain(token_ids, (0,)), self.state_size + 1, pad_left=True, pad_symbol=0)
+
+    def intern_list(self, objs: Iterable[str]) -> array:
+        return array('I', map(self._intern, objs))
+
+    def decode(self, token_ids: Iterable[int]) -> list[term]:
+        return [self._tokens[token_id] for token_id in token_ids]
+
+    def learn_token_ids(self, token_ids: Iterable[int]):
+        for *state, token_id in self._windows(token_ids):
+            for key in self._suffix_keys(state):
+                self._learn_ids(key, token_id)
+
+    def learn_list(self, objs: Iterable[str]):
+        self.learn_token_ids(map(self._intern, objs))
+
+    def learn_str(self, string: str):
+        self.learn_list(string.split())
+
+    def unlearn(self, state: tuple[term, ...], obj: term):
+        token_ids = [self._token_ids.get(x) for x in (*state, obj)]
+        if None not in token_ids:
+            *state_ids, token_id = token_ids
+            self._unlearn_ids(self._pack(state_ids), token_id)
+
+    def unlearn_list(self, objs: Iterable[str]):
+        token_ids = [self._token_ids.get(obj) for obj in objs]
+        # Learning interns every token, so this was never learned
+        if None not in token_ids:
+            self.unlearn_token_ids(token_ids)
+
+    def unlearn_token_ids(self, token_ids: Iterable[int]):
+        for *state, token_id in self._windows(token_ids):
+            for key in self._suffix_keys(state):
+                self._unlearn_ids(key, token_id)
+
+    def unlearn_str(self, string: str):
+        self.unlearn_list(string.split())
+
+    def _backoff(self, state: typing.Sequence[int]) -> typing.Optional[int]:
+        """The key of the longest suffix of state that has successors.
+        Learning adds every suffix of a state along with it, so the walk
+        down the trie can stop at the first one missing."""
+        found = None
+        for key in self._suffix_keys(state):
+            if key not in self.tbl:
+                break
+            found = key
+        return found
+
+    def generate(self, max_count=64, seed: term = None):
+        """Up to max_count tokens. With a seed, the result starts with it
+        and continues from wherever it has been seen; a seed nothing has
+        followed gives nothing."""
+        if seed is None:
+            result = []
+            state = deque([0] * self.state_size, maxlen=self.state_size)
+        else:
+            if (seed_id := self._token_ids.get(self.__lower(seed))) is None:
+                return []
+            # Interned tokens outlive the messages that used them
+            if self._backoff([seed_id]) is None:
+                return []
+            result = [seed]
+            state = deque([seed_id], maxlen=self.state_size)
+        while len(result) < max_count:
+            if (key := self._backoff(state)) is None:
+                break
+            successors = self.tbl[key]
+            if isinstance(successors, int):
+                token_id = successors >> 32
+            else:
+                token_id = self._weighted_choice(key, successors)
+            if token_id == 0:
+                break
+            next_obj = self._tokens[token_id]
+            result.append(next_obj)
+            # A state containing a token that was never learned can't be in the table
+            if (state_id := self._token_ids.get(self.__lower(next_obj))) is None:
+                break
+            state.append(state_id)
+        return result
+
+    def _weighted_choice(self, key: int, successors: array) -> int:
+        try:
+            cumulative = self._cumulative[key]
+        except KeyError:
+            cumulative = self._cumulative[key] = array(
+                'Q',
+                accumulate(entry & self.COUNT_MASK for entry in successors)
+            )
+        return successors[bisect_right(cumulative, randrange(cumulative[-1]))] >> 32
+
+    def __lower(self, obj: str):
+        return str(obj).lower() if self.store_lowercase else obj
+
+    def generate_str(self, max_count=64, seed: term = None):
+        return ' '.join(self.generate(max_count, seed))
+
+    def stats(self) -> dict[str, int]:
+        """Sizes of the chain. bytes is what its containers and their
+        contents take, not counting small ints Python shares."""
+        transitions = 0
+        nbytes = sum(map(sys.getsizeof, (self.tbl, self._tokens, self._token_ids, self._cumulative)))
+        for key, successors in self.tbl.items():
+            transitions += 1 if isinstance(successors, int) else len(successors)
+            nbytes += sys.getsizeof(key) + sys.getsizeof(successors)
+        nbytes += sum(map(sys.getsizeof, self._tokens))
+        nbytes += sum(map(sys.getsizeof, self._cumulative.values()))
+        return {
+            'states': len(self.tbl),
+            'transitions': transitions,
+            'tokens': len(self._tokens) - 1,
+            'bytes': nbytes,
+        }
+
+
+class CounterChain:
+    """The original dict-of-Counters chain, kept as a reference for Chain."""
+
     # tbl = { ( state0, state1, ... ): { next_obj: count, ... }, ... }
     def __init__(self, state_size=2, store_lowercase=False):
         self.tbl: defaultdict[tuple[term], Counter] = defaultdict(Counter)
@@ -47,7 +307,7 @@ class Chain:
         self.tbl[state][obj] += 1
 
     def learn_list(self, objs: Iterable[str]):
-        for *state, word in nltk.ngrams(objs, self.state_size + 1, pad_left=True, pad_right=True):
+        for *state, word in ngrams(objs, self.state_size + 1, pad_left=True, pad_right=True):
             self.learn(tuple(state), word)
 
     def learn_str(self, string: str):
@@ -62,7 +322,7 @@ class Chain:
                     self.tbl.pop(state)
 
     def unlearn_list(self, objs: Iterable[str]):
-        for *state, word in nltk.ngrams(objs, self.state_size + 1, pad_left=True, pad_right=True):
+        for *state, word in ngrams(objs, self.state_size + 1, pad_left=True, pad_right=True):
             self.unlearn(tuple(state), word)
 
     def unlearn_str(self, string: str):
@@ -83,3 +343,36 @@ class Chain:
 
     def generate_str(self, max_count=64):
         return ' '.join(self.generate(max_count))
+
+
+class ChainWorker:
+    """Runs jobs one at a time, in the order they were submitted, on a
+    thread of its own. A chain handed to a worker should only be touched
+    from jobs on that worker."""
+
+    def __init__(self, name='markov'):
+        self._jobs: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while (job := self._jobs.get()) is not None:
+            future, fn, args = job
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+
+    def submit(self, fn: Callable[..., R], *args) -> 'concurrent.futures.Future[R]':
+        future = concurrent.futures.Future()
+        self._jobs.put((future, fn, args))
+        return future
+
+    async def run(self, fn: Callable[..., R], *args) -> R:
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def close(self):
+        """Finish the jobs already submitted, then stop."""
+        self._jobs.put(None)
+        self._thread.join()
@@ -0,0 +1,36 @@
+# PikalaxBOT - A Discord bot in discord.py
+# Copyright (C) 2018-2021  PikalaxALT
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import functools
+
+
+__all__ = (
+    'word_tokenizer',
+    'tokenize',
+)
+
+
+@functools.lru_cache(maxsize=None)
+def word_tokenizer():
+    """The process-wide word tokenizer. nltk is only imported the first
+    time something is tokenized."""
+    import nltk
+    return nltk.TreebankWordTokenizer()
+
+
+@functools.lru_cache(maxsize=1024)
+def tokenize(text: str) -> tuple[str, ...]:
+    return tuple(word_tokenizer().tokenize(text))
@@ -16,3 +16,4 @@
 
 from .models import *
 from .methods import *
+from .tables import *
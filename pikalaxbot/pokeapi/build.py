@@ -0,0 +1,215 @@
+# PikalaxBOT - A Discord bot in discord.py
+# Copyright (C) 2018-2021  PikalaxALT
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Incremental loader for the PokeAPI sqlite database.
+
+Run as a script by setup_pokeapi.sh, so this module sticks to the
+standard library. Each CSV under data/v2/csv is hashed and compared
+against a manifest stored in the database itself. Only tables whose
+CSV changed are reloaded. If a changed CSV can't be mapped onto a
+pokemon_v2_* table column for column, the script exits with
+NEEDS_FULL_BUILD and the caller falls back to pokeapi's build_all.
+
+usage: build.py [--record] DATABASE CSV_DIR
+"""
+
+import os
+import sys
+import csv
+import glob
+import hashlib
+import sqlite3
+import argparse
+import typing
+
+
+__all__ = (
+    'NEEDS_FULL_BUILD',
+    'UnmappableCSV',
+    'hash_csvs',
+    'changed_csvs',
+    'table_for_csv',
+    'column_map',
+    'load_tables',
+    'record_manifest',
+    'update',
+)
+
+NEEDS_FULL_BUILD = 2
+MANIFEST_TABLE = 'pikalaxbot_csv_manifest'
+
+# CSV header -> column name, where pokeapi's build renames the field
+COLUMN_RENAMES = {
+    'identifier': 'name',
+    'local_language_id': 'language_id',
+}
+
+
+class UnmappableCSV(Exception):
+    pass
+
+
+def hash_csvs(csv_dir: str) -> dict[str, str]:
+    hashes: dict[str, str] = {}
+    for path in sorted(glob.glob(os.path.join(csv_dir, '*.csv'))):
+        with open(path, 'rb') as fp:
+            hashes[os.path.basename(path)] = hashlib.sha256(fp.read()).hexdigest()
+    return hashes
+
+
+def _ensure_manifest(conn: sqlite3.Connection):
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS {} ('
+        'filename TEXT PRIMARY KEY, '
+        'sha256 TEXT NOT NULL'
+        ')'.format(MANIFEST_TABLE)
+    )
+
+
+def changed_csvs(conn: sqlite3.Connection, hashes: dict[str, str]) -> typing.Optional[list[str]]:
+    """Names of CSVs whose hash differs from the manifest, or None if
+    the database has no manifest yet (i.e. was never built by us)."""
+    _ensure_manifest(conn)
+    recorded = dict(conn.execute('SELECT filename, sha256 FROM {}'.format(MANIFEST_TABLE)))
+    if not recorded:
+        return None
+    return [filename for filename, digest in hashes.items() if recorded.get(filename) != digest]
+
+
+def _table_names(conn: sqlite3.Connection) -> set[str]:
+    return {name for name, in conn.execute(
+        'SELECT tbl_name '
+        'FROM sqlite_master '
+        'WHERE type = \'table\' '
+        'AND tbl_name LIKE \'pokemon_v2_%\''
+    )}
+
+
+def table_for_csv(filename: str, tables: set[str]) -> str:
+    # pokemon_species_names.csv -> pokemon_v2_pokemonspeciesname
+    stem = os.path.splitext(filename)[0].replace('_', '')
+    candidates = [stem]
+    if stem.endswith('ies'):
+        candidates.append(stem[:-3] + 'y')
+    if stem.endswith('es'):
+        candidates.append(stem[:-2])
+    if stem.endswith('s'):
+        candidates.append(stem[:-1])
+    for candidate in candidates:
+        if (table := 'pokemon_v2_' + candidate) in tables:
+            return table
+    raise UnmappableCSV(f'{filename}: no matching table')
+
+
+def column_map(conn: sqlite3.Connection, filename: str, table: str, header: list[str]) -> list[str]:
+    """Table column for each CSV column. Every table column the CSV
+    doesn't cover must be nullable or the primary key."""
+    info = {
+        name: (notnull, dflt, pk)
+        for cid, name, coltype, notnull, dflt, pk in conn.execute('PRAGMA table_info ("{}")'.format(table))
+    }
+    columns: list[str] = []
+    for field in header:
+        if field in info:
+            columns.append(field)
+        elif (renamed := COLUMN_RENAMES.get(field)) in info and renamed not in header:
+            columns.append(renamed)
+        else:
+            raise UnmappableCSV(f'{filename}: no column for {field!r} in {table}')
+    for name, (notnull, dflt, pk) in info.items():
+        if name not in columns and notnull and dflt is None and not pk:
+            raise UnmappableCSV(f'{filename}: nothing to fill {table}.{name}')
+    return columns
+
+
+def load_tables(conn: sqlite3.Connection, csv_dir: str, filenames: typing.Iterable[str]) -> list[str]:
+    """Resolve every CSV first, then reload all of them in one transaction."""
+    tables = _table_names(conn)
+    plan: list[tuple[str, str, list[str]]] = []
+    for filename in filenames:
+        table = table_for_csv(filename, tables)
+        with open(os.path.join(csv_dir, filename), newline='', encoding='utf-8') as fp:
+            header = next(csv.reader(fp))
+        plan.append((filename, table, column_map(conn, filename, table, header)))
+
+    with conn:
+        for filename, table, columns in plan:
+            conn.execute('DELETE FROM "{}"'.format(table))
+            with open(os.path.join(csv_dir, filename), newline='', encoding='utf-8') as fp:
+                reader = csv.reader(fp)
+                next(reader)
+                conn.executemany(
+                    'INSERT INTO "{}" ({}) VALUES ({})'.format(
+                        table,
+                        ', '.join(f'"{column}"' for column in columns),
+                        ', '.join('?' * len(columns))
+                    ),
+                    ([value if value != '' else None for value in row] for row in reader)
+                )
+    for filename, table, columns in plan:
+        conn.execute('REINDEX "{}"'.format(table))
+    return [table for filename, table, columns in plan]
+
+
+def record_manifest(conn: sqlite3.Connection, hashes: dict[str, str]):
+    _ensure_manifest(conn)
+    with conn:
+        conn.execute('DELETE FROM {}'.format(MANIFEST_TABLE))
+        conn.executemany('INSERT INTO {} VALUES (?, ?)'.format(MANIFEST_TABLE), hashes.items())
+
+
+def update(conn: sqlite3.Connection, csv_dir: str) -> typing.Optional[list[str]]:
+    """Reload changed tables and return their names, or None if a full
+    build is needed."""
+    hashes = hash_csvs(csv_dir)
+    changed = changed_csvs(conn, hashes)
+    if changed is None:
+        return None
+    if not changed:
+        return []
+    try:
+        tables = load_tables(conn, csv_dir, changed)
+    except UnmappableCSV as e:
+        print(e, file=sys.stderr)
+        return None
+    conn.execute('ANALYZE')
+    record_manifest(conn, hashes)
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally update the PokeAPI database from its CSVs')
+    parser.add_argument('--record', action='store_true', help='only record the current CSV hashes (after a full build)')
+    parser.add_argument('database')
+    parser.add_argument('csv_dir')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    try:
+        if args.record:
+            record_manifest(conn, hash_csvs(args.csv_dir))
+            return 0
+        tables = update(conn, args.csv_dir)
+    finally:
+        conn.close()
+    if tables is None:
+        return NEEDS_FULL_BUILD
+    print('Reloaded {} table(s): {}'.format(len(tables), ', '.join(tables) or 'none'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
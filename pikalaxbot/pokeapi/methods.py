@@ -15,29 +15,140 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import re
+import os
 import math
 import typing
 import random
 import json
+import asyncio
+import sqlite3
 import asqlite3
 if typing.TYPE_CHECKING:
     from ..bot import PikalaxBOT
 
 from .models import PokeapiModel, collection
+from .tables import load_derived_tables, replace_sidecar
 
 
-async def make_pokeapi(bot: 'PikalaxBOT'):
-    if bot._pokeapi_file:
-        db = await asqlite3.connect(bot._pokeapi_file, uri=True)
-        await PokeapiModel.prepare(db)
+# Tables that must be populated for the bot to be usable at all
+REQUIRED_TABLES = (
+    'pokemon_v2_language',
+    'pokemon_v2_pokemonspecies',
+    'pokemon_v2_pokemonspeciesname',
+    'pokemon_v2_pokemon',
+    'pokemon_v2_move',
+    'pokemon_v2_movename',
+    'pokemon_v2_type',
+    'pokemon_v2_ability',
+)
+
+# How long the retired connection stays open after a swap, so that
+# commands which already grabbed it can finish.
+RETIRE_GRACE_PERIOD = 60
+
+
+async def open_pokeapi(file: str) -> tuple[asqlite3.Connection, type]:
+    db = await asqlite3.connect(file, uri=True)
+    try:
+        classes = await PokeapiModel.prepare_detached(db)
         db.__dict__.update({
             key: value
-            for key, value in PokeapiModel.classes.__dict__.items()
+            for key, value in classes.__dict__.items()
             if not key.startswith('__')
         })
+        tables = await db.run_sync(load_derived_tables)
+        db.move_table = tables['move']
+        db.species_table = tables['species']
+    except Exception:
+        await db.close()
+        raise
+    return db, classes
+
+
+async def make_pokeapi(bot: 'PikalaxBOT'):
+    if bot._pokeapi_file:
+        db, classes = await open_pokeapi(bot._pokeapi_file)
+        PokeapiModel.swap(db, classes)
         return db
 
 
+def _quick_check(conn: sqlite3.Connection) -> str:
+    return conn.execute('PRAGMA quick_check').fetchone()[0]
+
+
+def _row_counts(conn: sqlite3.Connection) -> dict[str, int]:
+    tables = [name for name, in conn.execute(
+        'SELECT tbl_name '
+        'FROM sqlite_master '
+        'WHERE type = \'table\' '
+        'AND tbl_name LIKE \'pokemon_v2_%\''
+    )]
+    return {
+        table: conn.execute('SELECT COUNT(*) FROM "{}"'.format(table)).fetchone()[0]
+        for table in tables
+    }
+
+
+async def validate_pokeapi(new: asqlite3.Connection, old: typing.Optional[asqlite3.Connection] = None):
+    """Sanity check a freshly built database before it goes live.
+    If old is given, the new database must not lose any of its tables
+    or empty out any table that used to have rows."""
+    if (result := await new.run_sync(_quick_check)) != 'ok':
+        raise ValueError(f'integrity check failed: {result}')
+    counts = await new.run_sync(_row_counts)
+    if empty := [table for table in REQUIRED_TABLES if not counts.get(table)]:
+        raise ValueError('missing or empty tables: ' + ', '.join(empty))
+    if old is not None:
+        old_counts = await old.run_sync(_row_counts)
+        if missing := sorted(old_counts.keys() - counts.keys()):
+            raise ValueError('tables dropped by rebuild: ' + ', '.join(missing))
+        if emptied := sorted(table for table, count in old_counts.items() if count and not counts[table]):
+            raise ValueError('tables emptied by rebuild: ' + ', '.join(emptied))
+
+
+async def _retire(db: asqlite3.Connection):
+    try:
+        await asyncio.sleep(RETIRE_GRACE_PERIOD)
+    finally:
+        await db.close()
+
+
+def cancel_retirements(bot: 'PikalaxBOT') -> list[asyncio.Task]:
+    """Cut short the grace period of every retired connection, e.g. on
+    shutdown. Returns the tasks, which finish once they're closed."""
+    tasks = list(bot._pokeapi_retiring)
+    for task in tasks:
+        task.cancel()
+    return tasks
+
+
+async def hot_swap_pokeapi(bot: 'PikalaxBOT', new_file: str, live_file: str):
+    """Bring the database at new_file online in place of the current one.
+
+    Everything expensive (opening, validating, building the model classes
+    and the move table) happens while the old database keeps serving.
+    The swap itself is synchronous, and the old connection is closed
+    after a grace period."""
+    db, classes = await open_pokeapi('file:{}?mode=ro'.format(new_file))
+    try:
+        await validate_pokeapi(db, bot._pokeapi)
+    except Exception:
+        await db.close()
+        raise
+    # The open connection follows the inode, so it survives the rename.
+    # So do the sidecar's mappings.
+    os.replace(new_file, live_file)
+    replace_sidecar(new_file, live_file)
+    old = bot._pokeapi
+    PokeapiModel.swap(db, classes)
+    bot._pokeapi = db
+    if old is not None:
+        # Held by the bot so it isn't collected before the close runs
+        task = asyncio.create_task(_retire(old))
+        bot._pokeapi_retiring.add(task)
+        task.add_done_callback(bot._pokeapi_retiring.discard)
+
+
 def _clean_name(name: str):
     name = name.replace('♀', '_F').replace('♂', '_M').replace('é', 'e')
     name = re.sub(r'\W+', '_', name).title()
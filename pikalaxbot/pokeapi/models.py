@@ -48,7 +48,6 @@ DICTIONARY = [
     'egg', 'dex'
 ]
 pluralizer = inflect.engine()
-_prep_lock = asyncio.Lock()
 
 
 def tblname_to_classname(name: str):
@@ -182,6 +181,37 @@ class classproperty:
         return self._func(owner)
 
 
+class NameIndex:
+    """In-memory equivalent of PokeapiModel.get_named over one table.
+    Exact (casefolded) names win before falling back to the same fuzzy
+    scan, so "steel" no longer resolves to Seel."""
+
+    def __init__(self, rows: list[tuple[int, ...]]):
+        # (id, *casefolded names) in table order
+        self.rows = [(id_, *(name.casefold() for name in names if name)) for id_, *names in rows]
+        self.exact: dict[str, int] = {}
+        for id_, *names in self.rows:
+            for name in names:
+                self.exact.setdefault(name, id_)
+        self.differ = difflib.SequenceMatcher(lambda s: _garbage_pat.match(s) is not None)
+
+    def find(self, name: str, cutoff=0.9) -> typing.Optional[int]:
+        name = name.casefold()
+        if (id_ := self.exact.get(name)) is not None:
+            return id_
+        # Same ratio as FUZZY_RATIO. seq2 is the one difflib caches, so
+        # it holds the query. The quick ratios are upper bounds on ratio.
+        differ = self.differ
+        differ.set_seq2(name)
+        for id_, *names in self.rows:
+            for candidate in names:
+                differ.set_seq1(candidate)
+                if differ.real_quick_ratio() > cutoff \
+                        and differ.quick_ratio() > cutoff \
+                        and differ.ratio() > cutoff:
+                    return id_
+
+
 @functools.total_ordering
 class PokeapiModel:
     __abstract__ = True
@@ -217,7 +247,7 @@ class PokeapiModel:
             yield column, getattr(self, column)
 
     @classmethod
-    async def _prepare(cls, connection: asqlite3.Connection):
+    async def _prepare(cls, connection: asqlite3.Connection) -> type:
         classes: dict[str, type['PokeapiModel']] = {}
         tbl_names = [x async for x, in await connection.execute(
             "select tbl_name "
@@ -269,17 +299,28 @@ class PokeapiModel:
 
                 setattr(table_cls, manytoonekey, relationship(dest, local_col, dest_col, manytoonekey))
                 setattr(dest_cls, onetomanykey, backref(tbl_name, dest_col, local_col, onetomanykey))
-        cls.classes = type('Base', (object,), classes)
+        return type('Base', (object,), classes)
+
+    @classmethod
+    async def prepare_detached(cls, connection: asqlite3.Connection) -> type:
+        """Build the model classes for connection without installing them.
+        The result is meant to be passed to swap once it's been validated."""
+        classes = await cls._prepare(connection)
+        await cls.register_functions(connection)
+        return classes
 
     @classmethod
-    async def prepare(cls, connection: asqlite3.Connection):
+    def swap(cls, connection: asqlite3.Connection, classes: type):
+        # No awaits here, so nothing can observe a half-swapped state.
+        # Instances of the old classes stay usable since equality and
+        # hashing are keyed on the table name rather than the class.
         cls._connection = connection
-        if not cls.__prepared__:
-            async with _prep_lock:
-                if not cls.__prepared__:
-                    await cls._prepare(connection)
-                    cls.__prepared__ = True
+        cls.classes = classes
+        cls.__cache__ = {}
+        cls.__prepared__ = True
 
+    @staticmethod
+    async def register_functions(connection: asqlite3.Connection):
         differ = difflib.SequenceMatcher(lambda s: _garbage_pat.match(s) is not None)
 
         def fuzzy_ratio(a, b):
@@ -352,6 +393,35 @@ class PokeapiModel:
         if row:
             return await cls.from_row(row)
 
+    @classmethod
+    async def name_index(cls) -> NameIndex:
+        # Built on first use. Shared future so concurrent callers build it once,
+        # and shielded so a cancelled caller doesn't take it down for everyone.
+        if (fut := cls.__dict__.get('_name_index')) is None:
+            name_cls = getattr(cls.classes, cls.__name__ + 'Name')
+            fk_name = re.sub(r'([a-z])([A-Z])', r'\1_\2', cls.__name__).lower() + '_id'
+            lang_attr_name = 'local_language_id' if cls.__name__ == 'Language' else 'language_id'
+            columns = '{0}.id, {1}.name, {0}.name' if hasattr(cls, 'name') else '{0}.id, {1}.name'
+            statement = (
+                'SELECT ' + columns + ' FROM {0} INNER JOIN {1} ON {0}.id = {1}.{2} WHERE {1}.{3} = 9'
+            ).format(cls.__tablename__, name_cls.__tablename__, fk_name, lang_attr_name)
+            fut = asyncio.ensure_future(cls._connection.run_sync(
+                lambda conn: NameIndex(conn.execute(statement).fetchall())
+            ))
+            cls._name_index = fut
+        return await asyncio.shield(fut)
+
+    @classmethod
+    async def find_named(
+            cls: type[_T],
+            name: str,
+            *,
+            cutoff=0.9
+    ) -> typing.Optional[_T]:
+        """Like get_named, but served from an in-memory index of the names."""
+        if (id_ := (await cls.name_index()).find(name, cutoff)) is not None:
+            return await cls.get(id_)
+
     @classmethod
     async def convert(
             cls: type[_T],
@@ -386,14 +456,14 @@ class PokeapiModel:
 
     def __eq__(self, other):
         try:
-            return self.__class__ is other.__class__ and self.id == other.id
+            return self.__tablename__ == other.__tablename__ and self.id == other.id
         except AttributeError:
             return False
 
     def __lt__(self, other):
-        if self.__class__ is other.__class__:
+        if isinstance(other, PokeapiModel) and self.__tablename__ == other.__tablename__:
             return self.id < other.id
         return NotImplemented
 
     def __hash__(self):
-        return hash((self.__class__, self.id))
+        return hash((self.__tablename__, self.id))
@@ -0,0 +1,743 @@
+# PikalaxBOT - A Discord bot in discord.py
+# Copyright (C) 2018-2021  PikalaxALT
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import hashlib
+import operator
+import argparse
+import typing
+import numpy as np
+
+
+__all__ = ('MoveTable', 'SortedColumn', 'SpeciesTable', 'build_sidecar', 'load_derived_tables', 'replace_sidecar')
+
+# Bump whenever the layout of the arrays written to the sidecar changes
+SIDECAR_VERSION = 3
+# Written by build.py, which can't be imported from here when run as a script
+MANIFEST_TABLE = 'pikalaxbot_csv_manifest'
+
+# Sentinel for NULL in the int16 columns. Can't use -1 because priority goes negative.
+NULL = np.iinfo(np.int16).min
+
+COMPARATORS: dict[str, typing.Callable[[np.ndarray, int], np.ndarray]] = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '=': operator.eq,
+    '!=': operator.ne,
+}
+
+
+def _fetch_lookup(conn: sqlite3.Connection, table: str, fk_name: str) -> dict[str, int]:
+    lookup: dict[str, int] = {}
+    for id_, identifier, name in conn.execute(
+        'SELECT t.id, t.name, n.name '
+        'FROM pokemon_v2_{0} t '
+        'LEFT JOIN pokemon_v2_{0}name n '
+        'ON n.{1} = t.id '
+        'AND n.language_id = 9'.format(table, fk_name)
+    ):
+        lookup.setdefault(identifier.casefold(), id_)
+        if name:
+            lookup.setdefault(name.casefold(), id_)
+    return lookup
+
+
+class MoveTable:
+    """Columnar snapshot of pokemon_v2_move for vectorized movesearch.
+
+    Every column is a numpy array indexed by row, where rows are moves
+    ordered by id. Masks returned by the filter helpers can be combined
+    with the usual bitwise operators."""
+
+    COLUMNS = (
+        'id',
+        'type_id',
+        'move_damage_class_id',
+        'power',
+        'accuracy',
+        'pp',
+        'priority',
+        'move_target_id',
+        'contest_type_id',
+        'generation_id',
+    )
+    RANGE_COLUMNS = ('power', 'accuracy', 'pp', 'priority')
+    LOOKUPS = {
+        'type': 'type_id',
+        'movedamageclass': 'move_damage_class_id',
+        'contesttype': 'contest_type_id',
+        'movetarget': 'move_target_id',
+        'moveattribute': 'move_attribute_id',
+    }
+
+    id: np.ndarray
+    type_id: np.ndarray
+    move_damage_class_id: np.ndarray
+    power: np.ndarray
+    accuracy: np.ndarray
+    pp: np.ndarray
+    priority: np.ndarray
+    move_target_id: np.ndarray
+    contest_type_id: np.ndarray
+    generation_id: np.ndarray
+
+    def __init__(
+            self,
+            columns: dict[str, np.ndarray],
+            flags: np.ndarray,
+            learners: np.ndarray,
+            species_ids: np.ndarray,
+            names: np.ndarray,
+            name_order: np.ndarray,
+            lookups: dict[str, dict[str, int]]
+    ):
+        for column in self.COLUMNS:
+            setattr(self, column, columns[column])
+        # Bit n is set iff the move has move attribute n
+        self.flags = flags
+        # Packed bitset per move, one bit per species in species_ids order
+        self.learners = learners
+        self.species_ids = species_ids
+        self.names = names
+        # Row indices sorted by casefolded name
+        self.name_order = name_order
+        self.lookups = lookups
+
+    def __len__(self):
+        return len(self.id)
+
+    @classmethod
+    def from_connection(cls, conn: sqlite3.Connection) -> 'MoveTable':
+        rows = conn.execute(
+            'SELECT {} '
+            'FROM pokemon_v2_move '
+            'ORDER BY id'.format(', '.join(cls.COLUMNS))
+        ).fetchall()
+        columns = {
+            column: np.array([NULL if x is None else x for x in values], dtype=np.int16)
+            for column, values in zip(cls.COLUMNS, zip(*rows))
+        }
+        move_ids = columns['id']
+        n_moves = len(move_ids)
+
+        names = [''] * n_moves
+        for move_id, name in conn.execute(
+            'SELECT move_id, name '
+            'FROM pokemon_v2_movename '
+            'WHERE language_id = 9'
+        ):
+            names[np.searchsorted(move_ids, move_id)] = name
+
+        flags = np.zeros(n_moves, dtype=np.uint64)
+        for move_id, attr_id in conn.execute(
+            'SELECT move_id, move_attribute_id '
+            'FROM pokemon_v2_moveattributemap'
+        ):
+            flags[np.searchsorted(move_ids, move_id)] |= np.uint64(1 << attr_id)
+
+        species_ids = np.array([id_ for id_, in conn.execute(
+            'SELECT id '
+            'FROM pokemon_v2_pokemonspecies '
+            'ORDER BY id'
+        )], dtype=np.int16)
+        learnsets = np.zeros((n_moves, len(species_ids)), dtype=bool)
+        for species_id, move_id in conn.execute(
+            'SELECT DISTINCT pv2p.pokemon_species_id, pv2pm.move_id '
+            'FROM pokemon_v2_pokemonmove pv2pm '
+            'INNER JOIN pokemon_v2_pokemon pv2p ON pv2pm.pokemon_id = pv2p.id '
+            'WHERE pv2p.is_default = TRUE'
+        ):
+            learnsets[np.searchsorted(move_ids, move_id), np.searchsorted(species_ids, species_id)] = True
+
+        lookups = {
+            table: _fetch_lookup(conn, table, fk_name)
+            for table, fk_name in cls.LOOKUPS.items()
+        }
+        name_order = np.array(sorted(range(n_moves), key=lambda i: names[i].casefold()), dtype=np.int32)
+        return cls(
+            columns,
+            flags,
+            np.packbits(learnsets, axis=1),
+            species_ids,
+            np.array(names, dtype=str),
+            name_order,
+            lookups
+        )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        arrays = {column: getattr(self, column) for column in self.COLUMNS}
+        arrays.update(
+            flags=self.flags,
+            learners=self.learners,
+            species_ids=self.species_ids,
+            names=self.names,
+            name_order=self.name_order,
+        )
+        for table, lookup in self.lookups.items():
+            arrays[f'lookup_{table}_keys'] = np.array(list(lookup), dtype=str)
+            arrays[f'lookup_{table}_values'] = np.array(list(lookup.values()), dtype=np.int16)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> 'MoveTable':
+        lookups = {
+            table: dict(zip(arrays[f'lookup_{table}_keys'].tolist(), arrays[f'lookup_{table}_values'].tolist()))
+            for table in cls.LOOKUPS
+        }
+        return cls(
+            {column: arrays[column] for column in cls.COLUMNS},
+            arrays['flags'],
+            arrays['learners'],
+            arrays['species_ids'],
+            arrays['names'],
+            arrays['name_order'],
+            lookups
+        )
+
+    def lookup(self, table: str, name: str) -> typing.Optional[int]:
+        return self.lookups[table].get(name.strip().casefold())
+
+    def compare(self, column: str, ineq: str, value: int) -> np.ndarray:
+        values: np.ndarray = getattr(self, column)
+        return (values != NULL) & COMPARATORS[ineq](values, value)
+
+    def has_attribute(self, attr_id: int) -> np.ndarray:
+        return self.flags & np.uint64(1 << attr_id) != 0
+
+    def learners_of(self, move_id: int) -> np.ndarray:
+        """Mask over species_ids of the species whose default form learns the move."""
+        row = np.searchsorted(self.id, move_id)
+        if row == len(self) or self.id[row] != move_id:
+            return np.zeros(len(self.species_ids), dtype=bool)
+        return np.unpackbits(self.learners[row], count=len(self.species_ids)).astype(bool)
+
+    def learned_by(self, species_id: int) -> np.ndarray:
+        idx = np.searchsorted(self.species_ids, species_id)
+        if idx == len(self.species_ids) or self.species_ids[idx] != species_id:
+            return np.zeros(len(self), dtype=bool)
+        return (self.learners[:, idx >> 3] >> (7 - (idx & 7))) & 1 != 0
+
+    def all(self) -> np.ndarray:
+        return np.ones(len(self), dtype=bool)
+
+    def sorted_rows(self, mask: np.ndarray) -> np.ndarray:
+        return self.name_order[mask[self.name_order]]
+
+    async def resolve_names(self, rows: typing.Sequence[int]) -> list[str]:
+        return self.names[np.asarray(rows, dtype=np.intp)].tolist()
+
+
+class SortedColumn:
+    """A species column sorted once, so that comparing every species
+    against a value is a pair of binary searches. Rows where the column
+    is NULL never compare true."""
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+        valid = np.flatnonzero(values != NULL)
+        self.order = valid[np.argsort(values[valid], kind='stable')]
+        self.sorted = values[self.order]
+        # Number of species with a strictly smaller value, and that as a
+        # fraction of the species with a value. NULL rows are ranked -1.
+        self.ranks = np.full(len(values), -1, dtype=np.intp)
+        self.ranks[self.order] = np.searchsorted(self.sorted, self.sorted, 'left')
+        self.quantiles = self.ranks / max(len(self.order), 1)
+
+    def __len__(self):
+        return len(self.values)
+
+    def rank(self, value) -> int:
+        return int(np.searchsorted(self.sorted, value, 'left'))
+
+    def quantile(self, value) -> float:
+        return self.rank(value) / max(len(self.order), 1)
+
+    def compare(self, comparator: str, value) -> np.ndarray:
+        """Mask of species whose value is <, >, or = value."""
+        lo = np.searchsorted(self.sorted, value, 'left')
+        hi = np.searchsorted(self.sorted, value, 'right')
+        rows = {
+            '<': self.order[:lo],
+            '>': self.order[hi:],
+            '=': self.order[lo:hi],
+        }[comparator]
+        mask = np.zeros(len(self.values), dtype=bool)
+        mask[rows] = True
+        return mask
+
+
+class SpeciesTable:
+    """Columnar snapshot of pokemon_v2_pokemonspecies, plus the default
+    pokemon of each species, for vectorized dexsearch name resolution
+    and the Q20 candidate engine.
+
+    Rows are species ordered by id, the same order as MoveTable.species_ids.
+    Predicates return boolean masks over rows."""
+
+    ARRAYS = (
+        'ids',
+        'names',
+        'generation_id',
+        'color_id',
+        'shape_id',
+        'habitat_id',
+        'evolution_chain_id',
+        'evolves_from',
+        'gender_rate',
+        'is_legendary',
+        'is_mythical',
+        'is_baby',
+        'has_mega',
+        'chain_size',
+        'chain_branches',
+        'evolution_triggers',
+        'egg_groups',
+        'height',
+        'weight',
+        'types',
+        'stats',
+        'stat_names',
+        'type_ids',
+        'efficacy',
+        'ability_rows',
+        'ability_ids',
+        'dex_rows',
+        'dex_ids',
+    )
+
+    ids: np.ndarray
+    names: np.ndarray
+    generation_id: np.ndarray
+    color_id: np.ndarray
+    shape_id: np.ndarray
+    habitat_id: np.ndarray
+    evolution_chain_id: np.ndarray
+    evolves_from: np.ndarray
+    gender_rate: np.ndarray
+    is_legendary: np.ndarray
+    is_mythical: np.ndarray
+    is_baby: np.ndarray
+    # Any form of the species is a mega
+    has_mega: np.ndarray
+    # Number of species in the evolution chain
+    chain_size: np.ndarray
+    # Some species in the evolution chain evolves into more than one species
+    chain_branches: np.ndarray
+    # Bit n is set iff something evolves from the species by evolution trigger n
+    evolution_triggers: np.ndarray
+    # Bit n is set iff the species is in egg group n
+    egg_groups: np.ndarray
+    height: np.ndarray
+    weight: np.ndarray
+    # Type ids by slot, NULL if there's no second type
+    types: np.ndarray
+    # Base stats, one column per entry in stat_names
+    stats: np.ndarray
+    stat_names: np.ndarray
+    # efficacy[i, j] is the damage multiplier of type_ids[i] against type_ids[j]
+    type_ids: np.ndarray
+    efficacy: np.ndarray
+    # (row, ability_id) pairs for the abilities of the default pokemon
+    ability_rows: np.ndarray
+    ability_ids: np.ndarray
+    # (row, pokedex_id) pairs
+    dex_rows: np.ndarray
+    dex_ids: np.ndarray
+
+    UNDISCOVERED = 15
+    DITTO = 132
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.type_slots = np.where(self.types == NULL, -1, np.searchsorted(self.type_ids, self.types))
+        self._columns: dict[str, SortedColumn] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_connection(cls, conn: sqlite3.Connection) -> 'SpeciesTable':
+        rows = conn.execute(
+            'SELECT pv2ps.id, COALESCE(pv2psn.name, pv2ps.name), generation_id, pokemon_color_id, '
+            'pokemon_shape_id, pokemon_habitat_id, evolution_chain_id, evolves_from_species_id, '
+            'gender_rate, is_legendary, is_mythical, is_baby '
+            'FROM pokemon_v2_pokemonspecies pv2ps '
+            'LEFT JOIN pokemon_v2_pokemonspeciesname pv2psn '
+            'ON pv2psn.pokemon_species_id = pv2ps.id '
+            'AND pv2psn.language_id = 9 '
+            'ORDER BY pv2ps.id'
+        ).fetchall()
+        columns = list(zip(*rows)) if rows else [()] * 12
+
+        def int_column(values) -> np.ndarray:
+            return np.array([NULL if x is None else x for x in values], dtype=np.int16)
+
+        ids = int_column(columns[0])
+        n = len(ids)
+
+        def rows_of(species_ids: typing.Sequence[int]) -> np.ndarray:
+            return np.searchsorted(ids, np.array(species_ids, dtype=np.int16))
+
+        arrays = {
+            'ids': ids,
+            'names': np.array(columns[1], dtype=str),
+            'generation_id': int_column(columns[2]),
+            'color_id': int_column(columns[3]),
+            'shape_id': int_column(columns[4]),
+            'habitat_id': int_column(columns[5]),
+            'evolution_chain_id': int_column(columns[6]),
+            'evolves_from': int_column(columns[7]),
+            'gender_rate': int_column(columns[8]),
+            'is_legendary': np.array(columns[9], dtype=bool),
+            'is_mythical': np.array(columns[10], dtype=bool),
+            'is_baby': np.array(columns[11], dtype=bool),
+        }
+
+        has_mega = np.zeros(n, dtype=bool)
+        has_mega[rows_of([species_id for species_id, in conn.execute(
+            'SELECT DISTINCT pv2p.pokemon_species_id '
+            'FROM pokemon_v2_pokemonform pv2pf '
+            'INNER JOIN pokemon_v2_pokemon pv2p ON pv2pf.pokemon_id = pv2p.id '
+            'WHERE pv2pf.is_mega = TRUE'
+        )])] = True
+        arrays['has_mega'] = has_mega
+
+        chains = arrays['evolution_chain_id']
+        _, chain_inverse, chain_counts = np.unique(chains, return_inverse=True, return_counts=True)
+        arrays['chain_size'] = chain_counts[chain_inverse].astype(np.int16)
+        parents = arrays['evolves_from']
+        parent_rows = rows_of(parents[parents != NULL])
+        branches = np.bincount(parent_rows, minlength=n) > 1
+        arrays['chain_branches'] = np.isin(chains, chains[branches])
+
+        evolution_triggers = np.zeros(n, dtype=np.uint32)
+        for species_id, trigger_id in conn.execute(
+            'SELECT pv2ps.evolves_from_species_id, pv2pe.evolution_trigger_id '
+            'FROM pokemon_v2_pokemonevolution pv2pe '
+            'INNER JOIN pokemon_v2_pokemonspecies pv2ps ON pv2pe.evolved_species_id = pv2ps.id '
+            'WHERE pv2ps.evolves_from_species_id IS NOT NULL'
+        ):
+            evolution_triggers[np.searchsorted(ids, species_id)] |= np.uint32(1 << trigger_id)
+        arrays['evolution_triggers'] = evolution_triggers
+
+        egg_groups = np.zeros(n, dtype=np.uint32)
+        for species_id, egg_group_id in conn.execute(
+            'SELECT pokemon_species_id, egg_group_id '
+            'FROM pokemon_v2_pokemonegggroup'
+        ):
+            egg_groups[np.searchsorted(ids, species_id)] |= np.uint32(1 << egg_group_id)
+        arrays['egg_groups'] = egg_groups
+
+        height = np.full(n, NULL, dtype=np.int16)
+        weight = np.full(n, NULL, dtype=np.int16)
+        for species_id, height_, weight_ in conn.execute(
+            'SELECT pokemon_species_id, height, weight '
+            'FROM pokemon_v2_pokemon '
+            'WHERE is_default = TRUE'
+        ):
+            row = np.searchsorted(ids, species_id)
+            height[row] = height_
+            weight[row] = weight_
+        arrays['height'] = height
+        arrays['weight'] = weight
+
+        types = np.full((n, 2), NULL, dtype=np.int16)
+        for species_id, slot, type_id in conn.execute(
+            'SELECT pv2p.pokemon_species_id, pv2pt.slot, pv2pt.type_id '
+            'FROM pokemon_v2_pokemontype pv2pt '
+            'INNER JOIN pokemon_v2_pokemon pv2p ON pv2pt.pokemon_id = pv2p.id '
+            'WHERE pv2p.is_default = TRUE'
+        ):
+            types[np.searchsorted(ids, species_id), slot - 1] = type_id
+        arrays['types'] = types
+
+        stat_names = dict(conn.execute(
+            'SELECT stat_id, name '
+            'FROM pokemon_v2_statname '
+            'WHERE language_id = 9'
+        ))
+        stat_rows = conn.execute(
+            'SELECT pv2p.pokemon_species_id, pv2pst.stat_id, pv2pst.base_stat '
+            'FROM pokemon_v2_pokemonstat pv2pst '
+            'INNER JOIN pokemon_v2_pokemon pv2p ON pv2pst.pokemon_id = pv2p.id '
+            'WHERE pv2p.is_default = TRUE'
+        ).fetchall()
+        stat_ids = sorted({stat_id for _, stat_id, _ in stat_rows})
+        stats = np.zeros((n, len(stat_ids)), dtype=np.int16)
+        for species_id, stat_id, base_stat in stat_rows:
+            stats[np.searchsorted(ids, species_id), stat_ids.index(stat_id)] = base_stat
+        arrays['stats'] = stats
+        arrays['stat_names'] = np.array([stat_names.get(stat_id, str(stat_id)) for stat_id in stat_ids], dtype=str)
+
+        type_ids = np.array([type_id for type_id, in conn.execute(
+            'SELECT id '
+            'FROM pokemon_v2_type '
+            'ORDER BY id'
+        )], dtype=np.int16)
+        efficacy = np.ones((len(type_ids), len(type_ids)), dtype=np.float32)
+        for damage_type_id, target_type_id, damage_factor in conn.execute(
+            'SELECT damage_type_id, target_type_id, damage_factor '
+            'FROM pokemon_v2_typeefficacy'
+        ):
+            efficacy[np.searchsorted(type_ids, damage_type_id), np.searchsorted(type_ids, target_type_id)] \
+                = damage_factor / 100
+        arrays['type_ids'] = type_ids
+        arrays['efficacy'] = efficacy
+
+        ability_pairs = conn.execute(
+            'SELECT DISTINCT pv2p.pokemon_species_id, pv2pa.ability_id '
+            'FROM pokemon_v2_pokemonability pv2pa '
+            'INNER JOIN pokemon_v2_pokemon pv2p ON pv2pa.pokemon_id = pv2p.id '
+            'WHERE pv2p.is_default = TRUE'
+        ).fetchall()
+        arrays['ability_rows'] = rows_of([species_id for species_id, _ in ability_pairs]).astype(np.int16)
+        arrays['ability_ids'] = np.array([ability_id for _, ability_id in ability_pairs], dtype=np.int16)
+
+        dex_pairs = conn.execute(
+            'SELECT DISTINCT pokemon_species_id, pokedex_id '
+            'FROM pokemon_v2_pokemondexnumber'
+        ).fetchall()
+        arrays['dex_rows'] = rows_of([species_id for species_id, _ in dex_pairs]).astype(np.int16)
+        arrays['dex_ids'] = np.array([pokedex_id for _, pokedex_id in dex_pairs], dtype=np.int16)
+        return cls(arrays)
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> 'SpeciesTable':
+        return cls(arrays)
+
+    async def resolve_names(self, ids: typing.Sequence[int]) -> list[str]:
+        if not len(self):
+            return [f'#{id_}' for id_ in ids]
+        idx = np.searchsorted(self.ids, ids).clip(max=len(self) - 1)
+        return [
+            name if found else f'#{id_}'
+            for name, found, id_ in zip(self.names[idx].tolist(), (self.ids[idx] == ids).tolist(), ids)
+        ]
+
+    def index(self, species_id: int) -> typing.Optional[int]:
+        row = int(np.searchsorted(self.ids, species_id))
+        if row < len(self) and self.ids[row] == species_id:
+            return row
+        return None
+
+    def all(self) -> np.ndarray:
+        return np.ones(len(self), dtype=bool)
+
+    def none(self) -> np.ndarray:
+        return np.zeros(len(self), dtype=bool)
+
+    def _rows_mask(self, rows: np.ndarray) -> np.ndarray:
+        mask = self.none()
+        mask[rows] = True
+        return mask
+
+    def has_type(self, type_id: int) -> np.ndarray:
+        return (self.types == type_id).any(axis=1)
+
+    def type_count(self) -> np.ndarray:
+        return (self.types != NULL).sum(axis=1)
+
+    def matchup_against_type(self, type_id: int) -> np.ndarray:
+        """Damage multiplier of type_id against every species."""
+        factors = self.efficacy[np.searchsorted(self.type_ids, type_id)]
+        # Slot -1 (no type) picks up the appended neutral multiplier
+        factors = np.append(factors, np.float32(1))
+        return factors[self.type_slots].prod(axis=1)
+
+    def has_ability(self, ability_id: int) -> np.ndarray:
+        return self._rows_mask(self.ability_rows[self.ability_ids == ability_id])
+
+    def in_pokedex(self, pokedex_id: int) -> np.ndarray:
+        return self._rows_mask(self.dex_rows[self.dex_ids == pokedex_id])
+
+    def in_egg_group(self, egg_group_id: int) -> np.ndarray:
+        return self.egg_groups & np.uint32(1 << egg_group_id) != 0
+
+    def evolves_by(self, trigger_id: int) -> np.ndarray:
+        return self.evolution_triggers & np.uint32(1 << trigger_id) != 0
+
+    def in_family(self, row: int) -> np.ndarray:
+        return self.evolution_chain_id == self.evolution_chain_id[row]
+
+    def stat(self, stat_name: str) -> np.ndarray:
+        if stat_name == 'Stat Total':
+            return self.stats.sum(axis=1)
+        try:
+            column, = np.flatnonzero(self.stat_names == stat_name)
+        except ValueError:
+            return np.zeros(len(self), dtype=np.int16)
+        return self.stats[:, column]
+
+    def column(self, name: str) -> SortedColumn:
+        """Sorted height, weight, or stat column, built on first use."""
+        try:
+            return self._columns[name]
+        except KeyError:
+            values = getattr(self, name) if name in ('height', 'weight') else self.stat(name)
+            column = self._columns[name] = SortedColumn(np.asarray(values))
+            return column
+
+    def undiscovered(self) -> np.ndarray:
+        return self.in_egg_group(self.UNDISCOVERED)
+
+    def can_mate_with(self, row: int) -> np.ndarray:
+        """Vectorized methods.mon_can_mate_with against the species at row."""
+        undiscovered = self.undiscovered()
+        gender_rate = self.gender_rate
+        mate_rate = gender_rate[row]
+        if self.ids[row] == self.DITTO:
+            mask = ~undiscovered
+        else:
+            mask = ((self.egg_groups & self.egg_groups[row]) != 0) \
+                   & ~((gender_rate == mate_rate) & ((mate_rate == 0) | (mate_rate == 8))) \
+                   & (gender_rate != -1) \
+                   & (mate_rate != -1)
+            mask[self.ids == self.DITTO] = not undiscovered[row]
+        mask[row] = self.ids[row] != self.DITTO and mate_rate not in {0, 8, -1} and not undiscovered[row]
+        mask &= ~self.is_baby
+        if self.is_baby[row]:
+            mask[:] = False
+        return mask
+
+
+DERIVED_TABLES: dict[str, type[typing.Union[MoveTable, SpeciesTable]]] = {
+    'move': MoveTable,
+    'species': SpeciesTable,
+}
+
+
+def _database_file(conn: sqlite3.Connection) -> str:
+    for seq, name, file in conn.execute('PRAGMA database_list'):
+        if name == 'main':
+            return file
+    return ''
+
+
+def _sidecar_directory(db_file: str) -> str:
+    # Per file, so a database staged next to the live one has its own
+    return db_file + '.sidecar'
+
+
+def _db_fingerprint(conn: sqlite3.Connection, db_file: str) -> str:
+    """Identifies the database's contents without reading the whole file:
+    the hashes of the CSVs it was built from, as recorded by build.py, or
+    failing that the file's size and modification time."""
+    try:
+        manifest = conn.execute('SELECT filename, sha256 FROM {} ORDER BY filename'.format(MANIFEST_TABLE)).fetchall()
+    except sqlite3.OperationalError:
+        manifest = []
+    if manifest:
+        return 'manifest:' + hashlib.sha256(json.dumps(manifest).encode()).hexdigest()
+    stat = os.stat(db_file)
+    return f'stat:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def _load_sidecar(directory: str, fingerprint: str) -> typing.Optional[dict[str, dict[str, np.ndarray]]]:
+    try:
+        with open(os.path.join(directory, 'header.json')) as fp:
+            header = json.load(fp)
+        if header['version'] != SIDECAR_VERSION or header['db_fingerprint'] != fingerprint:
+            return None
+        return {
+            table: {
+                name: np.load(os.path.join(directory, f'{table}.{name}.npy'), mmap_mode='r')
+                for name in names
+            }
+            for table, names in header['arrays'].items()
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_sidecar(directory: str, fingerprint: str, arrays: dict[str, dict[str, np.ndarray]]):
+    tmpdir = directory + '.tmp'
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    os.makedirs(tmpdir)
+    for table, table_arrays in arrays.items():
+        for name, array in table_arrays.items():
+            np.save(os.path.join(tmpdir, f'{table}.{name}.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(tmpdir, 'header.json'), 'w') as fp:
+        json.dump({
+            'version': SIDECAR_VERSION,
+            'db_fingerprint': fingerprint,
+            'arrays': {table: list(table_arrays) for table, table_arrays in arrays.items()},
+        }, fp)
+    # Anything still mapping the old files keeps its pages after the unlink.
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(tmpdir, directory)
+
+
+def build_sidecar(conn: sqlite3.Connection):
+    """Write the derived tables of the database to the sidecar next to it.
+    setup_pokeapi.sh does this after every build."""
+    db_file = _database_file(conn)
+    _write_sidecar(_sidecar_directory(db_file), _db_fingerprint(conn, db_file), {
+        key: table.from_connection(conn).to_arrays()
+        for key, table in DERIVED_TABLES.items()
+    })
+
+
+def replace_sidecar(src_db_file: str, dst_db_file: str):
+    """Move the sidecar of src_db_file over that of dst_db_file, to
+    follow a rename of the database itself."""
+    src = _sidecar_directory(src_db_file)
+    dst = _sidecar_directory(dst_db_file)
+    shutil.rmtree(dst, ignore_errors=True)
+    if os.path.isdir(src):
+        os.rename(src, dst)
+
+
+def load_derived_tables(conn: sqlite3.Connection) -> dict[str, typing.Union[MoveTable, SpeciesTable]]:
+    """Load the derived tables from the sidecar next to the database,
+    rebuilding it first if it's missing or was built from a different
+    database. The arrays are memory-mapped read-only."""
+    db_file = _database_file(conn)
+    if not db_file:
+        return {key: table.from_connection(conn) for key, table in DERIVED_TABLES.items()}
+    directory = _sidecar_directory(db_file)
+    fingerprint = _db_fingerprint(conn, db_file)
+    if (arrays := _load_sidecar(directory, fingerprint)) is None:
+        # Not built by setup_pokeapi.sh, or built by an older version
+        build_sidecar(conn)
+        arrays = _load_sidecar(directory, fingerprint)
+    return {key: table.from_arrays(arrays[key]) for key, table in DERIVED_TABLES.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the derived-table sidecar next to a PokeAPI database')
+    parser.add_argument('database')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect('file:{}?mode=ro'.format(os.path.abspath(args.database)), uri=True)
+    try:
+        build_sidecar(conn)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+# PikalaxBOT - A Discord bot in discord.py
+# Copyright (C) 2018-2021  PikalaxALT
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import enum
+import heapq
+import typing
+import asyncio
+import datetime
+import itertools
+
+import discord
+
+__all__ = ('HistoryPriority', 'HistoryScheduler')
+
+
+class HistoryPriority(enum.IntEnum):
+    INTERACTIVE = 0
+    BACKFILL = 1
+    WARMUP = 2
+
+
+def _snowflake(
+        bound: typing.Union[discord.abc.Snowflake, datetime.datetime, None],
+        high: bool
+) -> typing.Optional[int]:
+    if bound is None:
+        return None
+    if isinstance(bound, datetime.datetime):
+        return discord.utils.time_snowflake(bound, high=high)
+    return bound.id
+
+
+class _Subscription:
+    """One caller's window (after, before) and limit. Offered messages
+    newest first, so it has everything it wants once it sees a message
+    at or below after, or has limit messages."""
+
+    def __init__(self, limit: typing.Optional[int], after: typing.Optional[int], before: typing.Optional[int]):
+        self.limit = limit
+        self.after = after
+        self.before = before
+        self.messages: list[discord.Message] = []
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def offer(self, message: discord.Message):
+        if self.future.done() or self.before is not None and message.id >= self.before:
+            return
+        if self.after is not None and message.id <= self.after:
+            self.finish()
+            return
+        self.messages.append(message)
+        if self.limit is not None and len(self.messages) >= self.limit:
+            self.finish()
+
+    def finish(self):
+        if not self.future.done():
+            self.future.set_result(self.messages[::-1])
+
+
+class _PageLimiter:
+    """Spaces page requests on the channel messages route at least
+    interval seconds apart across every walk. Walks waiting for a page
+    are let through in order of priority, so an interactive walk only
+    waits for the page already in flight."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._waiters: list[tuple[HistoryPriority, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._next = 0.
+        self._task: typing.Optional[asyncio.Task] = None
+
+    async def acquire(self, priority: HistoryPriority):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if not self._waiters and now >= self._next:
+            self._next = now + self.interval
+            return
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._grant())
+        await future
+
+    async def _grant(self):
+        loop = asyncio.get_running_loop()
+        while self._waiters:
+            if (delay := self._next - loop.time()) > 0:
+                await asyncio.sleep(delay)
+            *_, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                self._next = loop.time() + self.interval
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        for *_, future in self._waiters:
+            future.cancel()
+        self._waiters = []
+
+
+class _HistoryJob:
+    def __init__(self, channel: discord.TextChannel, priority: HistoryPriority):
+        self.channel = channel
+        self.priority = priority
+        self.subscribers: list[_Subscription] = []
+        # Everything walked so far, so late subscribers can catch up
+        self.walked: list[discord.Message] = []
+        self.start: typing.Optional[int] = None
+
+    @property
+    def active(self):
+        return any(not sub.future.done() for sub in self.subscribers)
+
+    def join(self, sub: _Subscription) -> bool:
+        """Add a subscriber to a walk in progress, if the walk started
+        above its window."""
+        if self.start is not None and (sub.before is None or sub.before > self.start):
+            return False
+        for message in self.walked:
+            sub.offer(message)
+        self.subscribers.append(sub)
+        return True
+
+    async def run(self, limiter: _PageLimiter):
+        if not self.active:
+            return
+        befores = [sub.before for sub in self.subscribers]
+        if None not in befores:
+            self.start = max(befores)
+        await limiter.acquire(self.priority)
+        async for message in self.channel.history(
+            limit=None,
+            before=discord.Object(self.start) if self.start is not None else None
+        ):
+            self.walked.append(message)
+            for sub in self.subscribers:
+                sub.offer(message)
+            if not self.active:
+                break
+            # The iterator fetches the next page of 100 when this one runs out
+            if len(self.walked) % 100 == 0:
+                await limiter.acquire(self.priority)
+        for sub in self.subscribers:
+            sub.finish()
+
+    def fail(self, error: BaseException):
+        for sub in self.subscribers:
+            if not sub.future.done():
+                sub.future.set_exception(error)
+
+
+class HistoryScheduler:
+    """Shared channel.history fetcher.
+
+    Requests for the same channel are served by a single walk back from
+    the newest message, which stops once every request has what it
+    asked for. At most concurrency channels are walked at once, one walk
+    per channel at a time, in order of priority. One more worker only
+    takes interactive walks, so those never queue behind a backfill.
+    Pages of every walk share one limit of a page per page_interval
+    seconds, handed out by priority."""
+
+    def __init__(self, *, concurrency=4, page_interval=0.1):
+        self.concurrency = concurrency
+        self._limiter = _PageLimiter(page_interval)
+        self._queue: typing.Optional[asyncio.PriorityQueue] = None
+        self._interactive_queue: typing.Optional[asyncio.PriorityQueue] = None
+        self._workers: list[asyncio.Task] = []
+        self._seq = itertools.count()
+        self._pending: dict[int, _HistoryJob] = {}
+        self._running: dict[int, _HistoryJob] = {}
+        self._channel_locks: dict[int, asyncio.Lock] = {}
+
+    async def fetch(
+            self,
+            channel: discord.TextChannel,
+            *,
+            limit: typing.Optional[int] = None,
+            after: typing.Union[discord.abc.Snowflake, datetime.datetime, None] = None,
+            before: typing.Union[discord.abc.Snowflake, datetime.datetime, None] = None,
+            priority=HistoryPriority.BACKFILL
+    ) -> list[discord.Message]:
+        """The newest limit messages in the channel between after and
+        before, oldest first. Same bounds as channel.history."""
+        if limit == 0:
+            return []
+        sub = _Subscription(limit, _snowflake(after, high=True), _snowflake(before, high=False))
+        job = self._running.get(channel.id)
+        if job is not None and job.join(sub):
+            # Its remaining pages go at the new subscriber's priority
+            job.priority = min(job.priority, priority)
+        else:
+            job = self._pending.get(channel.id)
+            if job is None:
+                job = self._pending[channel.id] = _HistoryJob(channel, priority)
+                self._queue_job(job)
+            elif priority < job.priority:
+                # The old queue entry is skipped when it comes up
+                job.priority = priority
+                self._queue_job(job)
+            job.subscribers.append(sub)
+        return await sub.future
+
+    def _queue_job(self, job: _HistoryJob):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._interactive_queue = asyncio.PriorityQueue()
+            self._workers = [asyncio.create_task(self._worker(self._queue)) for _ in range(self.concurrency)]
+            self._workers.append(asyncio.create_task(self._worker(self._interactive_queue)))
+        entry = (job.priority, next(self._seq), job)
+        # Whichever worker gets to it first runs it, the other skips it
+        self._queue.put_nowait(entry)
+        if job.priority == HistoryPriority.INTERACTIVE:
+            self._interactive_queue.put_nowait(entry)
+
+    async def _worker(self, queue: asyncio.PriorityQueue):
+        while True:
+            *_, job = await queue.get()
+            channel_id = job.channel.id
+            lock = self._channel_locks.setdefault(channel_id, asyncio.Lock())
+            async with lock:
+                if self._pending.get(channel_id) is not job:
+                    continue
+                del self._pending[channel_id]
+                self._running[channel_id] = job
+                try:
+                    await job.run(self._limiter)
+                except Exception as e:
+                    job.fail(e)
+                finally:
+                    del self._running[channel_id]
+            if not lock.locked() and channel_id not in self._pending:
+                self._channel_locks.pop(channel_id, None)
+
+    def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._queue = None
+        self._interactive_queue = None
+        self._limiter.close()
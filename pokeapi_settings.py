@@ -0,0 +1,25 @@
+# PikalaxBOT - A Discord bot in discord.py
+# Copyright (C) 2018-2021  PikalaxALT
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Django settings used by setup_pokeapi.sh. Same as pokeapi's own local
+# config, but the sqlite file is taken from the environment so that the
+# database can be rebuilt off to the side while the bot keeps reading
+# the live one.
+
+import os
+from config.local import *  # noqa: F401,F403
+
+DATABASES['default']['NAME'] = os.environ['POKEAPI_DB']  # noqa: F405
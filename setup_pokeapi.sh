@@ -1,7 +1,14 @@
 #!/bin/sh -xe
 
+# Usage: setup_pokeapi.sh [TARGET]
+# Builds the database into TARGET (default: pokeapi/db.sqlite3). When
+# TARGET is elsewhere, it starts from a copy of the live database, which
+# is never written to.
+
 prevdir=$(pwd)
-BOTDIR=$(dirname "$(realpath -P "$0")"); cd "${BOTDIR}"
+BOTDIR=$(dirname "$(realpath -P "$0")")
+TARGET=$(realpath -m "${1:-${BOTDIR}/pokeapi/db.sqlite3}")
+cd "${BOTDIR}"
 
 if ! [ -d pokeapi ]; then
   git submodule init
@@ -12,10 +19,26 @@ git submodule update --recursive --remote
 cd pokeapi
 # shellcheck disable=SC2046
 python3 -m pip install -U $(grep -v psycopg2 requirements.txt) psycopg2
-newfiles=$(find data/v2/csv -name "*.csv" -newer db.sqlite3 2> /dev/null || ls data/v2/csv/*.csv)
-make setup
-if [ -n "$newfiles" ]; then
-  python3 manage.py shell -c "from data.v2.build import build_all; build_all()" --settings=config.local
+if [ "$TARGET" != "$(realpath -m db.sqlite3)" ]; then
+  rm -f "$TARGET"
+  if [ -f db.sqlite3 ]; then
+    cp db.sqlite3 "$TARGET"
+  fi
+fi
+export POKEAPI_DB="$TARGET"
+export PYTHONPATH="${BOTDIR}${PYTHONPATH:+:${PYTHONPATH}}"
+python3 manage.py migrate --settings=pokeapi_settings
+# Reload only the tables whose CSVs changed. Exit status 2 means that
+# isn't possible (first build, or a CSV we can't map onto its table).
+status=0
+python3 "${BOTDIR}/pikalaxbot/pokeapi/build.py" "$TARGET" data/v2/csv || status=$?
+if [ "$status" -eq 2 ]; then
+  python3 manage.py shell -c "from data.v2.build import build_all; build_all()" --settings=pokeapi_settings
+  python3 "${BOTDIR}/pikalaxbot/pokeapi/build.py" --record "$TARGET" data/v2/csv
+elif [ "$status" -ne 0 ]; then
+  exit "$status"
 fi
+# Derived tables the bot memory-maps instead of computing at startup
+python3 "${BOTDIR}/pikalaxbot/pokeapi/tables.py" "$TARGET"
 
 cd "$prevdir"